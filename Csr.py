@@ -1,9 +1,19 @@
 import asyncio
 import os
+import re
+import json
+import math
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, urljoin
 from pydantic import BaseModel, Field
 from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode, LlmConfig
-from crawl4ai.deep_crawling import BFSDeepCrawlStrategy
 from crawl4ai.extraction_strategy import LLMExtractionStrategy
+from llm_telemetry import telemetry, labels
+
+# Query parameters that never change the page
+TRACKING_PARAMS = {'gclid', 'fbclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga'}
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+LLM_PROVIDER = "openai/gpt-4"
 
 # Define the schema for the extracted data
 class CSR_ESG_Link(BaseModel):
@@ -11,51 +21,281 @@ class CSR_ESG_Link(BaseModel):
     parent_url: str = Field(..., description="URL of the page containing the link.")
     link_text: str = Field(..., description="Text content of the hyperlink.")
 
+def canonicalize_url(url):
+    # One spelling per page: lower-case scheme and host, no default port, fragment or
+    # tracking parameters, sorted query, and "/" for an empty path
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and str(parts.port) != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS)
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+def site_of(url):
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+# Fixed-size set membership for very large frontiers: no false negatives, and false
+# positives (a page wrongly taken as seen) at about error_rate once capacity URLs are in.
+class BloomFilter:
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        # True when item was not seen before
+        new = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        return new
+
+
+class SeenSet:
+    def __init__(self):
+        self.urls = set()
+
+    def add(self, item):
+        if item in self.urls:
+            return False
+        self.urls.add(item)
+        return True
+
+
+def parse_extracted_links(extracted_content):
+    # crawl4ai returns the extraction as a JSON string: a list of items or {"links": [...]}
+    if not extracted_content:
+        return []
+    data = json.loads(extracted_content) if isinstance(extracted_content, str) else extracted_content
+    if isinstance(data, dict):
+        data = data.get('links', [])
+    return [item for item in data if isinstance(item, dict) and item.get('link_url')]
+
+
+# Local relevance scoring, so only likely CSR/ESG pages reach the LLM. Keyword hits in
+# the URL, the anchor text and the text around a link rank the frontier; a fetched page
+# adds hits in its own title and text and its links to report-like documents.
+POSITIVE_KEYWORDS = {
+    'csr': 4, 'esg': 4, 'sustainability': 4, 'sustainable': 3, 'responsibility': 3, 'brsr': 4,
+    'tcfd': 3, 'gri': 2, 'climate': 2, 'environment': 2, 'environmental': 2, 'governance': 2,
+    'emissions': 2, 'carbon': 2, 'diversity': 1, 'community': 1, 'social': 1, 'impact': 1,
+    'annual': 2, 'report': 2, 'reports': 2, 'investor': 2, 'investors': 2, 'disclosure': 2,
+    'disclosures': 2, 'policy': 1, 'policies': 1, 'download': 1,
+}
+NEGATIVE_KEYWORDS = {
+    'career': 4, 'careers': 4, 'job': 3, 'jobs': 3, 'vacancies': 3, 'cookie': 4, 'cookies': 4,
+    'privacy': 3, 'terms': 3, 'login': 4, 'signin': 4, 'register': 3, 'cart': 4, 'contact': 2,
+    'shop': 3, 'store': 2, 'faq': 2, 'sitemap': 2,
+}
+DOCUMENT_EXTENSIONS = ('.pdf', '.xlsx', '.xls', '.docx', '.doc')
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+class RelevanceScorer:
+    def __init__(self, positive=POSITIVE_KEYWORDS, negative=NEGATIVE_KEYWORDS, text_chars=20000):
+        self.positive = positive
+        self.negative = negative
+        self.text_chars = text_chars
+
+    def keyword_score(self, text):
+        score = 0
+        for word in set(_WORD_RE.findall((text or '').lower())):
+            score += self.positive.get(word, 0) - self.negative.get(word, 0)
+        return score
+
+    def link_score(self, url, anchor_text='', context=''):
+        # Priority of a frontier URL; a link to a document file is a strong hint
+        path = urlsplit(url).path.lower()
+        score = 2 * self.keyword_score(path.replace('-', ' ').replace('_', ' ').replace('/', ' '))
+        score += 2 * self.keyword_score(anchor_text) + self.keyword_score(context)
+        if path.endswith(DOCUMENT_EXTENSIONS):
+            score += 3
+        return score
+
+    def page_score(self, url, link_score, result):
+        # Whether a fetched page is worth an LLM extraction
+        metadata = getattr(result, 'metadata', None) or {}
+        text = str(getattr(result, 'markdown', '') or '')[:self.text_chars]
+        score = link_score + 2 * self.keyword_score(metadata.get('title', '')) + min(self.keyword_score(text), 10)
+        for link in iter_links(result):
+            href = (link.get('href') or '').lower()
+            if href.endswith(DOCUMENT_EXTENSIONS) and self.keyword_score(href + ' ' + (link.get('text') or '')) > 0:
+                score += 3
+        return score
+
+
+def iter_links(result):
+    links = getattr(result, 'links', None) or {}
+    for kind in ('internal', 'external'):
+        for link in links.get(kind, []):
+            yield link if isinstance(link, dict) else {'href': link}
+
+
+# Crawls many roots at once on one AsyncWebCrawler. Every page is fetched at most once
+# across all roots, whichever root reaches it first. Each root follows links within its
+# own site up to max_depth and stops after max_pages pages. The frontier is best-first by
+# link score, links scoring below min_link_score are not fetched, and only pages scoring
+# at least llm_threshold are sent to the LLM, re-using the HTML already fetched.
+# make_extract_config returns a fresh extraction config per LLM call, so the tokens its
+# strategy reports belong to that page alone.
+class CrawlCoordinator:
+    def __init__(self, crawler, fetch_config, make_extract_config, max_depth=2, max_pages=100, concurrency=8,
+                 use_bloom=False, bloom_capacity=1_000_000, scorer=None, llm_threshold=6, min_link_score=0):
+        self.crawler = crawler
+        self.fetch_config = fetch_config
+        self.make_extract_config = make_extract_config
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.scorer = scorer or RelevanceScorer()
+        self.llm_threshold = llm_threshold
+        self.min_link_score = min_link_score
+        self.seen = BloomFilter(bloom_capacity) if use_bloom else SeenSet()
+        self.link_seen = SeenSet()
+        self.pages_per_root = {}
+        self.sequence = 0
+        self.stats = {'pages_fetched': 0, 'pages_failed': 0, 'llm_calls': 0, 'pages_below_threshold': 0,
+                      'links_pruned': 0, 'duplicates_skipped': 0, 'over_budget': 0, 'links_found': 0}
+
+    def _schedule(self, queue, root, url, depth, score):
+        # The budget is taken when a page is queued, so a root never overshoots it
+        if self.pages_per_root.get(root, 0) >= self.max_pages:
+            self.stats['over_budget'] += 1
+            return
+        canonical = canonicalize_url(url)
+        if not self.seen.add(canonical):
+            self.stats['duplicates_skipped'] += 1
+            return
+        self.pages_per_root[root] = self.pages_per_root.get(root, 0) + 1
+        # Highest score first; the sequence number keeps equal scores in discovery order
+        self.sequence += 1
+        queue.put_nowait((-score, self.sequence, root, canonical, depth))
+
+    def _follow(self, queue, root, page_url, result, depth):
+        if depth >= self.max_depth:
+            return
+        for link in (getattr(result, 'links', None) or {}).get('internal', []):
+            if not isinstance(link, dict):
+                link = {'href': link}
+            if not link.get('href'):
+                continue
+            url = urljoin(page_url, link['href'])
+            if urlsplit(url).scheme not in ('http', 'https') or site_of(url) != site_of(root):
+                continue
+            # Documents are what the LLM reports from the linking page, not pages to render
+            if urlsplit(url).path.lower().endswith(DOCUMENT_EXTENSIONS):
+                continue
+            score = self.scorer.link_score(url, link.get('text') or '', link.get('title') or '')
+            if score < self.min_link_score:
+                self.stats['links_pruned'] += 1
+                continue
+            self._schedule(queue, root, url, depth + 1, score)
+
+    async def _extract(self, url, result, results):
+        # The LLM runs on the HTML already fetched, passed as a raw: URL, so the page is not loaded twice
+        html = getattr(result, 'cleaned_html', None) or result.html
+        config = self.make_extract_config()
+        with labels(document=url), telemetry.track(LLM_PROVIDER) as call:
+            extracted = await self.crawler.arun("raw:" + html, config=config)
+            # crawl4ai totals tokens per strategy, and this strategy only ran for this page
+            usage = getattr(config.extraction_strategy, 'total_usage', None)
+            if usage is not None:
+                call.input_tokens, call.output_tokens = usage.prompt_tokens, usage.completion_tokens
+        self.stats['llm_calls'] += 1
+        if not extracted.success:
+            return
+        for link in parse_extracted_links(extracted.extracted_content):
+            link_url = urljoin(url, link['link_url'])
+            # The same report linked from several pages or roots is kept once
+            if self.link_seen.add(canonicalize_url(link_url)):
+                results.append(CSR_ESG_Link(link_url=link_url, parent_url=url, link_text=link.get('link_text', '')))
+                self.stats['links_found'] += 1
+
+    async def _worker(self, queue, results):
+        while True:
+            negative_score, _, root, url, depth = await queue.get()
+            try:
+                result = await self.crawler.arun(url, config=self.fetch_config)
+                self.stats['pages_fetched'] += 1
+                if not result.success:
+                    self.stats['pages_failed'] += 1
+                    continue
+                if self.scorer.page_score(url, -negative_score, result) >= self.llm_threshold:
+                    await self._extract(url, result, results)
+                else:
+                    self.stats['pages_below_threshold'] += 1
+                self._follow(queue, root, url, result, depth)
+            except Exception as e:
+                self.stats['pages_failed'] += 1
+                print(f"Error while crawling {url}: {e}")
+            finally:
+                queue.task_done()
+
+    async def run(self, roots):
+        queue = asyncio.PriorityQueue()
+        results = []
+        for root in roots:
+            self._schedule(queue, root, root, 0, 0)
+        workers = [asyncio.create_task(self._worker(queue, results)) for _ in range(self.concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return results
+
 # Asynchronous function to extract CSR and ESG-related links
-async def extract_csr_esg_links(urls, max_depth):
+async def extract_csr_esg_links(urls, max_depth, max_pages=100, concurrency=8, use_bloom=False, llm_threshold=6):
     # Configure the browser for headless operation
     browser_config = BrowserConfig(headless=True, verbose=True)
     
     # Configure the LLM with your API key
-    llm_config = LlmConfig(provider="openai/gpt-4", api_token=os.getenv('OPENAI_API_KEY'))
+    llm_config = LlmConfig(provider=LLM_PROVIDER, api_token=os.getenv('OPENAI_API_KEY'))
     
-    # Define the extraction strategy using the LLM
-    extraction_strategy = LLMExtractionStrategy(
-        llm_config=llm_config,
-        schema=CSR_ESG_Link.model_json_schema(),
-        extraction_type="schema",
-        instruction=(
-            "Identify and extract links to documents related to Corporate Social Responsibility (CSR) or "
-            "Environment, Social, and Governance (ESG) reports. Provide the link URL, the parent URL, "
-            "and the hyperlink's text content. Note that the link URL may not always end with '.pdf'."
+    # Define the extraction strategy using the LLM; one per LLM call so its token usage is per page
+    def make_extract_config():
+        extraction_strategy = LLMExtractionStrategy(
+            llm_config=llm_config,
+            schema=CSR_ESG_Link.model_json_schema(),
+            extraction_type="schema",
+            instruction=(
+                "Identify and extract links to documents related to Corporate Social Responsibility (CSR) or "
+                "Environment, Social, and Governance (ESG) reports. Provide the link URL, the parent URL, "
+                "and the hyperlink's text content. Note that the link URL may not always end with '.pdf'."
+            )
         )
-    )
-    
-    # Configure the crawler run settings
-    run_config = CrawlerRunConfig(
-        cache_mode=CacheMode.BYPASS,
-        extraction_strategy=extraction_strategy,
-        max_depth=max_depth
-    )
-
-    # Initialize the web crawler
+        return CrawlerRunConfig(
+            cache_mode=CacheMode.BYPASS,
+            extraction_strategy=extraction_strategy
+        )
+
+    # Pages are fetched without extraction; the coordinator decides which ones go to the LLM
+    fetch_config = CrawlerRunConfig(cache_mode=CacheMode.BYPASS)
+
+    # One crawler shared by all roots, with a global seen-set so no page is fetched twice
     async with AsyncWebCrawler(config=browser_config) as crawler:
-        results = []
-        for url in urls:
-            # Use Breadth-First Search strategy for deep crawling
-            deep_crawl_strategy = BFSDeepCrawlStrategy(crawler, run_config)
-            async for result in deep_crawl_strategy.arun(url):
-                if result.success and result.extracted_content:
-                    # Extract links identified by the LLM as CSR or ESG-related
-                    links = [
-                        CSR_ESG_Link(
-                            link_url=link['link_url'],
-                            parent_url=link['parent_url'],
-                            link_text=link['link_text']
-                        )
-                        for link in result.extracted_content.get('links', [])
-                    ]
-                    results.extend(links)
+        coordinator = CrawlCoordinator(crawler, fetch_config, make_extract_config, max_depth, max_pages, concurrency,
+                                       use_bloom, llm_threshold=llm_threshold)
+        with labels(endpoint="Csr.extract_csr_esg_links"):
+            results = await coordinator.run(urls)
+        stats = coordinator.stats
+        print(f"Crawl stats: {stats}")
+        print(f"Pages fetched: {stats['pages_fetched']}, sent to the LLM: {stats['llm_calls']}")
+        telemetry.write_summary()
         return results
 
 # Main function to execute the crawling process
@@ -1,73 +1,333 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Header
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel, Field
+from typing import List
+import io
+import asyncio
 import pandas as pd
-import fitz  # PyMuPDF
 import os
 from dotenv import load_dotenv
 from pydantic_ai import Agent
 from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai.providers.openai import OpenAIProvider
+from pydantic_ai.models.test import TestModel
+from pdf_text import extract_upload_document, extract_document, save_upload, shutdown_executor, PdfLimitExceeded
+from retrieval import IndexCache, HashingEmbedder
+from llm_cache import LLMCache, CachedAgent
+from artifact_cache import ArtifactCache
+from jobs import Job, JobStore, FairJobQueue, JobQueueFull, sse_message, result_csv, result_xlsx
+from llm_telemetry import telemetry, labels
 
 load_dotenv()
 
+# Question answering limits
+QA_MAX_CONCURRENCY = int(os.getenv("QA_MAX_CONCURRENCY", "5"))
+QA_TIMEOUT = float(os.getenv("QA_TIMEOUT", "60"))
+QA_RETRIES = int(os.getenv("QA_RETRIES", "2"))
+QA_BATCH_SIZE = int(os.getenv("QA_BATCH_SIZE", "10"))
+
+# Retrieval: only the top-k chunks relevant to a question go into its prompt
+QA_RETRIEVAL = os.getenv("QA_RETRIEVAL", "1") == "1"
+QA_TOP_K = int(os.getenv("QA_TOP_K", "5"))
+QA_CHUNK_SIZE = int(os.getenv("QA_CHUNK_SIZE", "1500"))
+QA_CHUNK_OVERLAP = int(os.getenv("QA_CHUNK_OVERLAP", "200"))
+QA_EMBEDDER = os.getenv("QA_EMBEDDER", "none")
+
+# Background jobs: workers running jobs, queued jobs allowed in total and per client, and how long results are kept
+QA_JOB_WORKERS = int(os.getenv("QA_JOB_WORKERS", "4"))
+QA_JOB_QUEUE_SIZE = int(os.getenv("QA_JOB_QUEUE_SIZE", "100"))
+QA_JOB_QUEUE_PER_CLIENT = int(os.getenv("QA_JOB_QUEUE_PER_CLIENT", "10"))
+QA_JOB_TTL = float(os.getenv("QA_JOB_TTL", "3600"))
+
+# Extracted text, chunks and embeddings are kept on disk by PDF hash, so a re-uploaded
+# document is neither parsed nor chunked and embedded again
+artifact_cache = ArtifactCache()
+
+index_cache = IndexCache(
+    max_documents=int(os.getenv("QA_INDEX_CACHE_SIZE", "32")),
+    artifact_cache=artifact_cache,
+    chunk_size=QA_CHUNK_SIZE,
+    overlap=QA_CHUNK_OVERLAP,
+    embedder=HashingEmbedder() if QA_EMBEDDER == "hashing" else None,
+)
+
 app = FastAPI()
 
+job_store = JobStore(ttl_seconds=QA_JOB_TTL)
+job_queue = FairJobQueue(QA_JOB_QUEUE_SIZE, QA_JOB_QUEUE_PER_CLIENT)
+job_workers = []
+
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Start the job workers with the app
+@app.on_event("startup")
+async def start_job_workers():
+    job_workers.extend(asyncio.create_task(job_worker()) for _ in range(QA_JOB_WORKERS))
+
+# Stop the job workers and the PDF extraction worker pool with the app
+@app.on_event("shutdown")
+async def stop_workers():
+    for worker in job_workers:
+        worker.cancel()
+    await asyncio.gather(*job_workers, return_exceptions=True)
+    shutdown_executor()
+
 # Pydantic response model
 class Answer(BaseModel):
     question: str = Field(description="The question asked.")
     answer: str = Field(description="Answer from the PDF content.")
 
-# Azure OpenAI setup using environment variables
-provider = OpenAIProvider(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    base_url=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_version="2024-02-01"
-)
+# Several answers returned by one structured call
+class Answers(BaseModel):
+    answers: List[Answer] = Field(description="One answer per question, in the order the questions were asked.")
 
-openai_model = OpenAIModel(
-    model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-    provider=provider
-)
+# QA_MODEL=test swaps Azure OpenAI for pydantic-ai's local TestModel, so the service runs without credentials
+if os.getenv("QA_MODEL", "azure") == "test":
+    openai_model = TestModel()
+else:
+    # Azure OpenAI setup using environment variables
+    provider = OpenAIProvider(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        base_url=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_version="2024-02-01"
+    )
+
+    openai_model = OpenAIModel(
+        model=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        provider=provider
+    )
+
+SYSTEM_PROMPT = "You are an expert assistant that answers questions based on provided context."
+MODEL_NAME = "test" if isinstance(openai_model, TestModel) else os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
+
+# Responses are cached on disk, so repeated questions on the same document cost no tokens
+llm_cache = LLMCache()
 
 # Initialize the PydanticAI Agent
-agent = Agent(
-    model=openai_model,
-    system_prompt="You are an expert assistant that answers questions based on provided context.",
-    result_type=Answer
+agent = CachedAgent(
+    Agent(model=openai_model, system_prompt=SYSTEM_PROMPT, result_type=Answer),
+    llm_cache, MODEL_NAME, SYSTEM_PROMPT, Answer
+)
+
+# Agent answering a batch of questions in one call
+batch_agent = CachedAgent(
+    Agent(model=openai_model, system_prompt=SYSTEM_PROMPT, result_type=Answers),
+    llm_cache, MODEL_NAME, SYSTEM_PROMPT, Answers
 )
 
-# Extract text from PDF
-def extract_text_from_pdf(pdf_file: UploadFile) -> str:
+# Extract text from PDF on the worker pool, page ranges in parallel, so other requests keep being served.
+# Returns the document's SHA-256 along with its text.
+async def extract_text_from_pdf(pdf_file: UploadFile):
     try:
-        pdf_reader = fitz.open(stream=pdf_file.file.read(), filetype="pdf")
-        return ''.join(page.get_text() for page in pdf_reader)
+        return await extract_upload_document(pdf_file, artifact_cache)
+    except PdfLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading PDF file: {e}")
 
+# Run one model call with a timeout, retrying with exponential backoff
+async def run_with_retries(run_agent, prompt):
+    for attempt in range(QA_RETRIES + 1):
+        try:
+            return await asyncio.wait_for(run_agent.run(prompt), QA_TIMEOUT)
+        except Exception:
+            if attempt == QA_RETRIES:
+                raise
+            telemetry.record_retry(run_agent.model_name)
+            await asyncio.sleep(2 ** attempt)
+
+# Pick the chunks of the document relevant to the questions; short documents are sent whole
+async def select_context(questions_list: List[str], pdf_text: str, document_key: str = None) -> str:
+    if not QA_RETRIEVAL or len(pdf_text) <= QA_TOP_K * QA_CHUNK_SIZE:
+        return pdf_text
+    index = await asyncio.to_thread(index_cache.get, pdf_text, document_key)
+    return index.context_for(questions_list, QA_TOP_K)
+
 # Get answer using the agent
-async def get_answer(question: str, context: str) -> str:
+async def get_answer(question: str, pdf_text: str, document_key: str = None) -> str:
+    context = await select_context([question], pdf_text, document_key)
     prompt = f"Context:\n{context}\n\nQuestion:\n{question}\n\nProvide a concise answer based on the context."
-    result = await agent.run(prompt)
+    result = await run_with_retries(agent, prompt)
     return result.data.answer
 
+# Answer a batch of questions with one structured call; anything the model skipped is asked on its own
+async def get_answers_batch(questions_batch: List[str], pdf_text: str, document_key: str = None) -> List[str]:
+    context = await select_context(questions_batch, pdf_text, document_key)
+    numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions_batch, 1))
+    prompt = (f"Context:\n{context}\n\nQuestions:\n{numbered}\n\n"
+              "Answer every question concisely based on the context, in the same order, repeating each question.")
+    result = await run_with_retries(batch_agent, prompt)
+    by_question = {item.question.strip(): item.answer for item in result.data.answers}
+    answers = []
+    for i, question in enumerate(questions_batch):
+        if question in by_question:
+            answers.append(by_question[question])
+        elif len(result.data.answers) == len(questions_batch):
+            answers.append(result.data.answers[i].answer)
+        else:
+            answers.append(await get_answer(question, pdf_text, document_key))
+    return answers
+
+# Answer all questions concurrently ("concurrent") or a few per call ("batched"), with at
+# most QA_MAX_CONCURRENCY model calls in flight. Yields (index, answer, error) as each
+# question (or batch) completes, so callers can pass answers on before the rest are done.
+async def iter_answers(questions_list: List[str], pdf_text: str, mode: str = "concurrent", document_key: str = None):
+    semaphore = asyncio.Semaphore(QA_MAX_CONCURRENCY)
+
+    async def answer_group(start, group):
+        async with semaphore:
+            try:
+                if mode == "batched":
+                    answers = await get_answers_batch(group, pdf_text, document_key)
+                else:
+                    # Telemetry attributes the call's tokens and latency to this question
+                    with labels(question=group[0]):
+                        answers = [await get_answer(group[0], pdf_text, document_key)]
+                return start, answers, None
+            except Exception as e:
+                return start, [None] * len(group), e
+
+    size = QA_BATCH_SIZE if mode == "batched" else 1
+    tasks = [asyncio.create_task(answer_group(i, questions_list[i:i + size])) for i in range(0, len(questions_list), size)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            start, answers, error = await next_done
+            for offset, answer in enumerate(answers):
+                yield start + offset, answer, error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def answer_questions(questions_list: List[str], pdf_text: str, mode: str = "concurrent",
+                           document_key: str = None) -> List[str]:
+    answers = [None] * len(questions_list)
+    async for index, answer, error in iter_answers(questions_list, pdf_text, mode, document_key):
+        if error is not None:
+            raise error
+        answers[index] = answer
+    return answers
+
+# Hit/miss counters of the response cache
+@app.get("/llm-cache/stats")
+async def llm_cache_stats():
+    return llm_cache.stats()
+
+# Model call telemetry in Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return telemetry.prometheus()
+
+# Model call telemetry as JSON: totals, per endpoint, latency percentiles and the costliest documents and questions
+@app.get("/llm-telemetry/summary")
+async def llm_telemetry_summary():
+    return telemetry.summary()
+
 # Endpoint to process PDF and questions
 @app.post("/process-pdf/")
-async def process_pdf(file: UploadFile = File(...), questions: str = Form(...)):
-    pdf_text = extract_text_from_pdf(file)
+async def process_pdf(file: UploadFile = File(...), questions: str = Form(...), mode: str = Form("concurrent")):
+    if mode not in ("concurrent", "batched"):
+        raise HTTPException(status_code=400, detail="mode must be 'concurrent' or 'batched'")
+    document_key, pdf_text = await extract_text_from_pdf(file)
     questions_list = [q.strip() for q in questions.strip().split("\n") if q.strip()]
 
-    answers = []
-    for question in questions_list:
-        answer = await get_answer(question, pdf_text)
-        answers.append(answer)
+    try:
+        with labels(endpoint="/process-pdf/", document=document_key):
+            answers = await answer_questions(questions_list, pdf_text, mode, document_key)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error generating answers: {e}")
 
+    # Written to memory, so concurrent requests never share an output file
     df = pd.DataFrame([answers], columns=questions_list)
-    output_file = "output.xlsx"
-    df.to_excel(output_file, index=False)
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
 
-    return FileResponse(
-        output_file,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        filename=output_file
+    return Response(
+        buffer.getvalue(),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={'Content-Disposition': 'attachment; filename="output.xlsx"'}
     )
+
+# Run one queued job: extract the saved upload, then answer its questions, publishing each answer as it lands
+async def run_job(job: Job):
+    path, sha256 = job.payload
+    try:
+        await job.set_status('extracting')
+        try:
+            pdf_text = await extract_document(path, sha256, artifact_cache)
+        finally:
+            os.remove(path)
+        await job.set_status('answering')
+        with labels(endpoint="/jobs/", document=sha256):
+            async for index, answer, error in iter_answers(job.questions, pdf_text, job.mode, sha256):
+                if error is not None:
+                    await job.set_error(index, str(error))
+                else:
+                    await job.set_answer(index, answer)
+        await job.set_status('done', answered=len(job.questions) - len(job.errors), errors=len(job.errors))
+    except Exception as e:
+        await job.set_status('failed', error=str(e))
+
+async def job_worker():
+    while True:
+        job = await job_queue.get()
+        await run_job(job)
+
+# Submit a PDF and its questions; answers are produced in the background
+@app.post("/jobs/", status_code=202)
+async def submit_job(file: UploadFile = File(...), questions: str = Form(...), mode: str = Form("concurrent"),
+                     x_client_id: str = Header(None)):
+    if mode not in ("concurrent", "batched"):
+        raise HTTPException(status_code=400, detail="mode must be 'concurrent' or 'batched'")
+    questions_list = [q.strip() for q in questions.strip().split("\n") if q.strip()]
+    if not questions_list:
+        raise HTTPException(status_code=400, detail="No questions given")
+    try:
+        # The upload is only saved here; extraction happens on a job worker
+        path, sha256 = await save_upload(file)
+    except PdfLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    job = Job(x_client_id or "anonymous", questions_list, mode, (path, sha256))
+    try:
+        await job_queue.put(job)
+    except JobQueueFull as e:
+        os.remove(path)
+        raise HTTPException(status_code=429, detail=str(e))
+    job_store.add(job)
+    return {'job_id': job.id, 'status': job.status, 'events': f"/jobs/{job.id}/events", 'result': f"/jobs/{job.id}/result"}
+
+def find_job(job_id: str) -> Job:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+# Status and the answers so far
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return find_job(job_id).summary()
+
+# Server-Sent Events: one "answer" (or "answer_error") event per question as it completes, then "done" or "failed"
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = find_job(job_id)
+
+    async def stream():
+        async for event, data in job.iter_events():
+            yield sse_message(event, data)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={'Cache-Control': 'no-cache'})
+
+# Results of a finished job as Excel or CSV, generated in memory
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str, format: str = "xlsx"):
+    job = find_job(job_id)
+    if job.status != 'done':
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    if format == "csv":
+        return Response(result_csv(job), media_type='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename="{job.id}.csv"'})
+    if format == "xlsx":
+        return Response(result_xlsx(job), media_type=XLSX_MEDIA_TYPE,
+                        headers={'Content-Disposition': f'attachment; filename="{job.id}.xlsx"'})
+    raise HTTPException(status_code=400, detail="format must be 'xlsx' or 'csv'")
@@ -1,5 +1,88 @@
+import re
+from collections import deque
+
+_WORD_RE = re.compile(r"\S+")
+
+
+def iter_normalized_lines(text):
+    # Stripped, non-empty lines, produced one at a time
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            yield line
+
+
 def normalize_markdown(text):
-    lines = [line.strip() for line in text.splitlines()]
-    # Remove empty lines
-    lines = [line for line in lines if line]
-    return '\n'.join(lines)
+    return '\n'.join(iter_normalized_lines(text))
+
+
+def token_counter(encoding_name="cl100k_base"):
+    # tiktoken when installed, so budgets match the embedding model; otherwise about 4/3 tokens per word
+    try:
+        import tiktoken
+    except ImportError:
+        return lambda text: (len(_WORD_RE.findall(text)) * 4 + 2) // 3
+    encoding = tiktoken.get_encoding(encoding_name)
+    return lambda text: len(encoding.encode_ordinary(text))
+
+
+def _split_long_line(line, max_tokens, count_tokens):
+    # A single line over the budget is cut between words
+    piece = []
+    for word in line.split(' '):
+        piece.append(word)
+        if len(piece) > 1 and count_tokens(' '.join(piece)) > max_tokens:
+            piece.pop()
+            yield ' '.join(piece)
+            piece = [word]
+    if piece:
+        yield ' '.join(piece)
+
+
+def iter_chunks(pages, max_tokens=512, overlap_tokens=64, count_tokens=None):
+    # Normalise and chunk page by page. pages yields page texts (numbered from 1) or
+    # (page_number, text) pairs. Each chunk is a dict with its text, token count, the
+    # first and last page it covers and its [start, end) character offsets in the
+    # normalised document. Only the lines of the chunk being built are held in memory.
+    count_tokens = count_tokens or token_counter()
+    window = deque()  # (line, page_number, start_offset, tokens)
+    window_tokens = 0
+    offset = 0
+
+    def emit():
+        return {
+            'text': '\n'.join(line for line, _, _, _ in window),
+            'tokens': window_tokens,
+            'page_start': window[0][1],
+            'page_end': window[-1][1],
+            'start': window[0][2],
+            'end': window[-1][2] + len(window[-1][0]),
+        }
+
+    for page_number, page in enumerate(pages, 1):
+        if isinstance(page, tuple):
+            page_number, page = page
+        for normalized_line in iter_normalized_lines(page):
+            pieces = [normalized_line]
+            if count_tokens(normalized_line) > max_tokens:
+                pieces = _split_long_line(normalized_line, max_tokens, count_tokens)
+            for line in pieces:
+                tokens = count_tokens(line)
+                if window and window_tokens + tokens > max_tokens:
+                    yield emit()
+                    # Keep trailing lines up to the overlap budget as the start of the next chunk
+                    kept = 0
+                    overlap = deque()
+                    while window:
+                        item = window.pop()
+                        if kept + item[3] > overlap_tokens or kept + item[3] + tokens > max_tokens:
+                            break
+                        overlap.appendleft(item)
+                        kept += item[3]
+                    window = overlap
+                    window_tokens = kept
+                window.append((line, page_number, offset, tokens))
+                window_tokens += tokens
+                offset += len(line) + 1
+    if window:
+        yield emit()
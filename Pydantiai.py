@@ -1,13 +1,15 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 from typing import List
 import pandas as pd
-import fitz  # PyMuPDF
 import os
 from dotenv import load_dotenv
 import openai
 from pydantic_ai import Agent, OpenAIModel
+from pdf_text import extract_upload_document, shutdown_executor, PdfLimitExceeded
+from llm_cache import LLMCache, CachedAgent
+from llm_telemetry import telemetry, labels
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,6 +17,11 @@ load_dotenv()
 # Initialize FastAPI app
 app = FastAPI()
 
+# Stop the PDF extraction worker pool with the app
+@app.on_event("shutdown")
+def stop_pdf_workers():
+    shutdown_executor()
+
 # Set OpenAI API key and endpoint from environment variables
 openai.api_type = "azure"
 openai.api_key = os.getenv('AZURE_OPENAI_API_KEY')
@@ -39,34 +46,53 @@ class AzureOpenAIClient:
         )
         return response
 
-# Initialize PydanticAI Agent with custom OpenAI client
+# Initialize PydanticAI Agent with custom OpenAI client, behind the shared response cache
+SYSTEM_PROMPT = 'You are an assistant extracting information from a PDF document to answer specific questions.'
 azure_openai_client = AzureOpenAIClient(deployment_name=os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME'))
-agent = Agent(
-    model=OpenAIModel(client=azure_openai_client),
-    system_prompt='You are an assistant extracting information from a PDF document to answer specific questions.',
-    result_type=Answer,
+llm_cache = LLMCache()
+agent = CachedAgent(
+    Agent(
+        model=OpenAIModel(client=azure_openai_client),
+        system_prompt=SYSTEM_PROMPT,
+        result_type=Answer,
+    ),
+    llm_cache, os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME'), SYSTEM_PROMPT, Answer
 )
 
-# Function to extract text from PDF
-def extract_text_from_pdf(pdf_file: UploadFile) -> str:
+# Function to extract text from PDF on the worker pool without blocking the event loop.
+# Returns the document's SHA-256 along with its text.
+async def extract_text_from_pdf(pdf_file: UploadFile):
     try:
-        pdf_reader = fitz.open(stream=pdf_file.file.read(), filetype="pdf")
-        text = ""
-        for page_num in range(len(pdf_reader)):
-            page = pdf_reader.load_page(page_num)
-            text += page.get_text()
-        return text
+        return await extract_upload_document(pdf_file)
+    except PdfLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading PDF file: {e}")
 
 # Function to get answer from PydanticAI Agent
 async def get_answer_from_agent(question: str, context: str) -> str:
     try:
-        result = await agent.run(question, context=context)
+        with labels(question=question):
+            result = await agent.run(question, context=context)
         return result.data.answer
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating answer: {e}")
 
+# Hit/miss counters of the response cache
+@app.get("/llm-cache/stats")
+async def llm_cache_stats():
+    return llm_cache.stats()
+
+# Model call telemetry in Prometheus text format
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return telemetry.prometheus()
+
+# Model call telemetry as JSON
+@app.get("/llm-telemetry/summary")
+async def llm_telemetry_summary():
+    return telemetry.summary()
+
 # Endpoint to process PDF and questions
 @app.post("/process-pdf/")
 async def process_pdf(
@@ -74,13 +100,14 @@ async def process_pdf(
     questions: str = Form(...)
 ):
     # Extract text from PDF
-    pdf_text = extract_text_from_pdf(file)
+    document_key, pdf_text = await extract_text_from_pdf(file)
 
     # Parse questions
     questions_list = questions.split("\n")
 
     # Generate answers
-    answers = [await get_answer_from_agent(question, pdf_text) for question in questions_list]
+    with labels(endpoint="/process-pdf/", document=document_key):
+        answers = [await get_answer_from_agent(question, pdf_text) for question in questions_list]
 
     # Create a DataFrame
     df = pd.DataFrame([answers], columns=questions_list)
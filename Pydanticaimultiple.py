@@ -1,27 +1,42 @@
 import os
+import asyncio
 import fitz  # PyMuPDF
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.vectorstores import ElasticsearchStore
 from langchain.chat_models import AzureChatOpenAI
 from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
+from langchain.callbacks import get_openai_callback
 from pydantic_ai import Agent
 from pydantic import BaseModel, Field
-import pandas as pd
 from typing import List
+from llm_cache import LLMCache, CachedAgent, RateLimiter
+from llm_telemetry import telemetry, labels
+from artifact_cache import ArtifactCache, sha256_file
+from ingestion import IngestManifest, ingest_directory, list_pdfs
+from pdf_scraper.writers import JsonlWriter, read_jsonl, export_excel
+
+# Files answered at once, and the cap on model calls per minute shared by all of them (0 = no cap)
+QA_FILE_CONCURRENCY = int(os.getenv("QA_FILE_CONCURRENCY", "8"))
+QA_CALLS_PER_MINUTE = float(os.getenv("QA_CALLS_PER_MINUTE", "0"))
+
+# Extract the pages of one PDF; files already parsed in an earlier run are read back from the artifact cache by hash
+def extract_pages_from_pdf(file_path: str, artifact_cache, sha256: str = None) -> List[str]:
+    sha256 = sha256 or sha256_file(file_path)
+    pages = artifact_cache.get_pages(sha256)
+    if pages is None:
+        with fitz.open(file_path) as doc:
+            pages = [page.get_text() for page in doc]
+        artifact_cache.put_pages(sha256, pages)
+    return pages
+
+def extract_text_from_pdf(file_path: str, artifact_cache, sha256: str = None) -> str:
+    return ''.join(extract_pages_from_pdf(file_path, artifact_cache, sha256))
 
 # Extract PDF text
-def extract_text_from_pdfs(directory: str) -> dict:
-    pdf_texts = {}
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.lower().endswith('.pdf'):
-                file_path = os.path.join(root, file)
-                doc = fitz.open(file_path)
-                text = ''
-                for page in doc:
-                    text += page.get_text()
-                pdf_texts[file_path] = text
-    return pdf_texts
+def extract_text_from_pdfs(directory: str, artifact_cache=None) -> dict:
+    artifact_cache = artifact_cache or ArtifactCache()
+    return {file_path: extract_text_from_pdf(file_path, artifact_cache) for file_path in list_pdfs(directory)}
 
 # Initialize Elasticsearch vector store
 def setup_vector_store(es_url: str, es_user: str, es_password: str, index_name: str):
@@ -44,62 +59,123 @@ def load_questions(filepath: str) -> List[str]:
 class QAResponse(BaseModel):
     responses: List[dict] = Field(description="List of question-answer pairs")
 
+# Key for a RetrievalQA answer: the chain setup, the prompt and the text it retrieves from
+def chain_cache_key(model_name, prompt, **scope):
+    return LLMCache.make_key(model_name, "RetrievalQA:stuff:k=5", prompt, **scope)
+
 # Get answers using RetrievalQA chain
-def get_answers(vector_store, llm, questions):
+def get_answers(vector_store, llm, questions, llm_cache=None):
+    llm_cache = llm_cache or LLMCache()
     retriever = vector_store.as_retriever(search_kwargs={"k": 5})
     qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=retriever)
 
     prompt = "\n".join(f"Q: {q}" for q in questions)
-    response = qa_chain.run(prompt)
+    response = llm_cache.get_or_call(
+        chain_cache_key(llm.deployment_name, prompt, index=vector_store.index_name),
+        lambda: qa_chain.run(prompt)
+    )
 
     # Initialize pydantic-ai agent for structured parsing
-    agent = Agent(model='openai:gpt-4', api_key='your_openai_api_key', result_type=QAResponse,
-                  system_prompt="Extract questions and their corresponding answers clearly.")
+    system_prompt = "Extract questions and their corresponding answers clearly."
+    agent = CachedAgent(
+        Agent(model='openai:gpt-4', api_key='your_openai_api_key', result_type=QAResponse, system_prompt=system_prompt),
+        llm_cache, 'openai:gpt-4', system_prompt, QAResponse
+    )
 
     structured_response = agent.run_sync(response)
     return structured_response.data.responses
 
-# Save to Excel
-def save_to_excel(data, questions, output_file):
-    df = pd.DataFrame(data)
-    columns_order = ['file_path'] + questions
-    df = df[columns_order]
-    df.to_excel(output_file, index=False)
+# Answer every file concurrently. The stuff-documents chain and the structuring agent are built
+# once by the caller and shared; each file only runs its own filtered retrieval. Rows are written
+# as files finish, so nothing is held in memory and finished files survive a crash.
+async def answer_files(documents, vector_store, qa_chain, agent, llm_cache, questions, writer,
+                       deployment_name, index_name, rate_limiter, concurrency=QA_FILE_CONCURRENCY):
+    semaphore = asyncio.Semaphore(concurrency)
+    prompt = "\n".join(f"Q: {q}" for q in questions)
+
+    def run_chain(file_path):
+        docs = vector_store.similarity_search(prompt, k=5, filter={"file_path": file_path})
+        rate_limiter.wait()
+        with telemetry.track(deployment_name) as call, get_openai_callback() as usage:
+            response = qa_chain.run(input_documents=docs, question=prompt)
+            call.input_tokens, call.output_tokens = usage.prompt_tokens, usage.completion_tokens
+        return response
+
+    async def answer_file(file_path, text_sha256):
+        async with semaphore:
+            try:
+                # Telemetry attributes both calls to this file
+                with labels(document=file_path):
+                    response = await asyncio.to_thread(
+                        llm_cache.get_or_call,
+                        chain_cache_key(deployment_name, prompt, index=index_name, text_sha256=text_sha256),
+                        lambda: run_chain(file_path)
+                    )
+                    # Structure response using pydantic-ai
+                    structured_response = await agent.run(response)
+            except Exception as e:
+                print(f"Error while answering {file_path}: {e}")
+                return False
+
+        row = {"file_path": file_path}
+        for qa_pair in structured_response.data.responses:
+            row[qa_pair['question']] = qa_pair['answer']
+        writer.write_many([row])
+        return True
+
+    results = await asyncio.gather(*(answer_file(path, sha256) for path, sha256 in documents.items()))
+    return sum(results)
 
 # Main Workflow
-def main(pdf_directory, es_url, es_user, es_password, index_name, questions_file, deployment_name, openai_api_key, output_file):
-    pdf_texts = extract_text_from_pdfs(pdf_directory)
+def main(pdf_directory, es_url, es_user, es_password, index_name, questions_file, deployment_name, openai_api_key, output_file,
+         concurrency=QA_FILE_CONCURRENCY, calls_per_minute=QA_CALLS_PER_MINUTE):
     vector_store = setup_vector_store(es_url, es_user, es_password, index_name)
 
-    # Add texts to vector store with metadata
-    for path, text in pdf_texts.items():
-        chunks = text.split('\n\n')
-        metadatas = [{"file_path": path} for _ in chunks]
-        vector_store.add_texts(chunks, metadatas=metadatas)
+    # Only new or changed files are parsed and embedded; chunks of changed or deleted files are dropped.
+    # A PDF already embedded under another path or in an earlier run reuses its cached chunks and vectors.
+    # Pages are normalised and cut into token-budgeted chunks carrying page numbers and offsets.
+    artifact_cache = ArtifactCache()
+    manifest = IngestManifest()
+    documents, ingest_stats = ingest_directory(
+        pdf_directory, vector_store, vector_store.embedding, manifest,
+        lambda file_path, sha256: extract_pages_from_pdf(file_path, artifact_cache, sha256),
+        artifact_cache=artifact_cache
+    )
+    manifest.close()
+    print(f"Ingestion: {ingest_stats}")
 
     llm = AzureChatOpenAI(deployment_name=deployment_name, openai_api_key=openai_api_key)
 
     questions = load_questions(questions_file)
 
-    results = []
-    for file_path in pdf_texts:
-        filtered_vector_store = vector_store.as_retriever(search_kwargs={"k": 5, "filter": {"file_path": file_path}})
-        qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=filtered_vector_store)
-
-        prompt = "\n".join(f"Q: {q}" for q in questions)
-        response = qa_chain.run(prompt)
-
-        # Structure response using pydantic-ai
-        agent = Agent(model='openai:gpt-4', api_key=openai_api_key, result_type=QAResponse,
-                      system_prompt="Provide structured pairs of questions and answers.")
-        structured_response = agent.run_sync(response)
+    # Repeat runs over the same filings and questionnaire are answered from the cache
+    llm_cache = LLMCache()
+    rate_limiter = RateLimiter(calls_per_minute)
 
-        row = {"file_path": file_path}
-        for qa_pair in structured_response.data.responses:
-            row[qa_pair['question']] = qa_pair['answer']
-        results.append(row)
+    # Built once and shared by every file
+    qa_chain = load_qa_chain(llm, chain_type="stuff")
+    system_prompt = "Provide structured pairs of questions and answers."
+    agent = CachedAgent(
+        Agent(model='openai:gpt-4', api_key=openai_api_key, result_type=QAResponse, system_prompt=system_prompt),
+        llm_cache, 'openai:gpt-4', system_prompt, QAResponse, rate_limiter
+    )
 
-    save_to_excel(results, questions, output_file)
+    # Rows stream to a JSONL file next to the output; the workbook is written from it at the end
+    fields = ['file_path'] + questions
+    rows_file = os.path.splitext(output_file)[0] + '.jsonl'
+    writer = JsonlWriter(rows_file, fields)
+    try:
+        with labels(endpoint="Pydanticaimultiple"):
+            answered = asyncio.run(answer_files(documents, vector_store, qa_chain, agent, llm_cache, questions, writer,
+                                                deployment_name, index_name, rate_limiter, concurrency))
+    finally:
+        writer.close()
+
+    export_excel(read_jsonl(rows_file), output_file, fields)
+    print(f"Answered {answered} of {len(documents)} files")
+    print(f"LLM cache: {llm_cache.stats()}")
+    # Tokens, latency and cost per file for this run
+    telemetry.write_summary()
 
 if __name__ == "__main__":
     # Replace these parameters accordingly
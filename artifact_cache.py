@@ -0,0 +1,146 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", "artifacts")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, data):
+    # Readers never see a half-written artifact
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _pack(texts):
+    # One UTF-8 blob plus [start, end) byte offsets per text
+    offsets = []
+    blob = bytearray()
+    for text in texts:
+        encoded = text.encode('utf-8', errors='replace')
+        offsets.append([len(blob), len(blob) + len(encoded)])
+        blob += encoded
+    return bytes(blob), offsets
+
+
+def _unpack(path, offsets):
+    with open(path, 'rb') as file:
+        blob = file.read()
+    return [blob[start:end].decode('utf-8') for start, end in offsets]
+
+
+# Artifacts derived from a PDF, keyed by the SHA-256 of its bytes:
+#   <root>/<sha[:2]>/<sha>/index.json          offsets and metadata
+#   <root>/<sha[:2]>/<sha>/pages.bin           page text
+#   <root>/<sha[:2]>/<sha>/chunks-<key>.bin    chunks for one chunking configuration
+#   <root>/<sha[:2]>/<sha>/embeddings-<key>.npy  float32 vectors, opened memory-mapped
+# Any entry point can look a document up here before parsing or embedding it.
+class ArtifactCache:
+    def __init__(self, root=ARTIFACT_CACHE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _folder(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def _read_index(self, sha256):
+        path = os.path.join(self._folder(sha256), 'index.json')
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def _update_index(self, sha256, section, value, key=None):
+        # Read-modify-write of index.json; with a key, value goes into a nested section
+        folder = self._folder(sha256)
+        with self._lock:
+            os.makedirs(folder, exist_ok=True)
+            index = self._read_index(sha256)
+            if key is None:
+                index[section] = value
+            else:
+                index.setdefault(section, {})[key] = value
+            _write_atomic(os.path.join(folder, 'index.json'), json.dumps(index).encode())
+
+    @staticmethod
+    def _safe_key(key):
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def get_pages(self, sha256):
+        offsets = self._read_index(sha256).get('pages')
+        if offsets is None:
+            return None
+        return _unpack(os.path.join(self._folder(sha256), 'pages.bin'), offsets)
+
+    def put_pages(self, sha256, pages):
+        os.makedirs(self._folder(sha256), exist_ok=True)
+        blob, offsets = _pack(pages)
+        _write_atomic(os.path.join(self._folder(sha256), 'pages.bin'), blob)
+        self._update_index(sha256, 'pages', offsets)
+
+    def get_text(self, sha256):
+        pages = self.get_pages(sha256)
+        return ''.join(pages) if pages is not None else None
+
+    def get_chunks(self, sha256, chunker_key):
+        entry = self._read_index(sha256).get('chunks', {}).get(chunker_key)
+        if entry is None:
+            return None
+        return _unpack(os.path.join(self._folder(sha256), entry['file']), entry['offsets'])
+
+    def put_chunks(self, sha256, chunker_key, chunks, metadata=None):
+        os.makedirs(self._folder(sha256), exist_ok=True)
+        file_name = f"chunks-{self._safe_key(chunker_key)}.bin"
+        blob, offsets = _pack(chunks)
+        _write_atomic(os.path.join(self._folder(sha256), file_name), blob)
+        self._update_index(sha256, 'chunks', {'file': file_name, 'offsets': offsets, 'metadata': metadata}, chunker_key)
+
+    def get_chunk_metadata(self, sha256, chunker_key):
+        entry = self._read_index(sha256).get('chunks', {}).get(chunker_key)
+        return entry.get('metadata') if entry else None
+
+    def get_embeddings(self, sha256, chunker_key, embedder_key):
+        import numpy as np
+
+        file_name = self._read_index(sha256).get('embeddings', {}).get(f"{chunker_key}|{embedder_key}")
+        if file_name is None:
+            return None
+        return np.load(os.path.join(self._folder(sha256), file_name), mmap_mode='r')
+
+    def put_embeddings(self, sha256, chunker_key, embedder_key, vectors):
+        import numpy as np
+
+        os.makedirs(self._folder(sha256), exist_ok=True)
+        key = f"{chunker_key}|{embedder_key}"
+        file_name = f"embeddings-{self._safe_key(key)}.npy"
+        path = os.path.join(self._folder(sha256), file_name)
+        # A temp file of its own per writer, like _write_atomic, so concurrent writers never share one
+        fd, temp_path = tempfile.mkstemp(dir=self._folder(sha256), suffix='.npy')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.save(file, np.asarray(vectors, dtype=np.float32))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self._update_index(sha256, 'embeddings', file_name, key)
@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from multiprocessing import Pool, cpu_count, get_context
+
+import normal
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Local fixture server standing in for Wikipedia. /list serves the same
+# "td .flagicon+ a" markup normal.get_links parses, and every /page/<n> waits
+# `latency` seconds (plus jitter), then fails with a 500 at `error_rate` or
+# returns `body_size` bytes.
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='text/html; charset=utf-8'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        settings = self.settings
+        if self.path == '/list':
+            rows = ''.join(
+                f'<tr><td><span class="flagicon"></span> <a href="/page/{i}">Country {i}</a></td></tr>'
+                for i in range(settings['pages'])
+            )
+            self._send(200, f'<html><body><table>{rows}</table></body></html>'.encode())
+        elif self.path.startswith('/page/'):
+            time.sleep(max(0.0, random.gauss(settings['latency'], settings['jitter'])))
+            if random.random() < settings['error_rate']:
+                self._send(500, b'error')
+            else:
+                self._send(200, b'x' * settings['body_size'])
+        else:
+            self._send(404, b'not found')
+
+
+def _serve_fixture(settings, port_queue):
+    FixtureHandler.settings = settings
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_fixture_server(settings):
+    # The server runs in its own process so it never competes for the measured process's GIL
+    context = get_context('spawn')
+    port_queue = context.Queue()
+    process = context.Process(target=_serve_fixture, args=(settings, port_queue), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+
+
+# Fetch strategies. Each returns one (latency, status) sample per link; the sync ones
+# reuse normal.fetch exactly as normal.py, concurrency.py and parallelism.py do.
+def timed_fetch(args):
+    link, output_folder = args
+    start = time.perf_counter()
+    try:
+        status = normal.fetch(link, output_folder)
+    except Exception:
+        status = None
+    return time.perf_counter() - start, status
+
+
+def run_sequential(links, workers, output_folder):
+    return [timed_fetch((link, output_folder)) for link in links]
+
+
+def run_threads(links, workers, output_folder):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(timed_fetch, [(link, output_folder) for link in links]))
+
+
+def run_processes(links, workers, output_folder):
+    with Pool(workers) as pool:
+        return pool.map(timed_fetch, [(link, output_folder) for link in links])
+
+
+async def _fetch_all_async(links, workers, output_folder):
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(workers)
+    connector = aiohttp.TCPConnector(limit=workers)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def fetch(link):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    async with session.get(link) as response:
+                        content = await response.read()
+                        status = response.status
+                    with open(os.path.join(output_folder, link.split("/")[-1] + ".html"), "wb") as f:
+                        f.write(content)
+                except Exception:
+                    status = None
+                return time.perf_counter() - start, status
+
+        return await asyncio.gather(*(fetch(link) for link in links))
+
+
+def run_asyncio(links, workers, output_folder):
+    return asyncio.run(_fetch_all_async(links, workers, output_folder))
+
+
+STRATEGIES = {
+    'sequential': run_sequential,
+    'threads': run_threads,
+    'processes': run_processes,
+    'asyncio': run_asyncio,
+}
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _usage():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+
+def _measure(strategy, links, workers, result_queue):
+    # Runs in a fresh process so CPU time and peak RSS belong to this strategy alone
+    with tempfile.TemporaryDirectory() as output_folder:
+        before = _usage()
+        start = time.perf_counter()
+        samples = STRATEGIES[strategy](links, workers, output_folder)
+        wall_time = time.perf_counter() - start
+        after = _usage()
+
+    result = {'wall_time': wall_time, 'samples': samples, 'cpu_time': None, 'peak_rss_mb': None, 'peak_child_rss_mb': None}
+    if after is not None:
+        cpu = lambda usage: usage.ru_utime + usage.ru_stime
+        result['cpu_time'] = sum(cpu(a) - cpu(b) for a, b in zip(after, before))
+        # ru_maxrss is kilobytes on Linux and bytes on macOS
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        result['peak_rss_mb'] = after[0].ru_maxrss / scale
+        result['peak_child_rss_mb'] = after[1].ru_maxrss / scale or None
+    result_queue.put(result)
+
+
+def measure_strategy(strategy, links, workers, poll_interval=1.0):
+    context = get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=_measure, args=(strategy, links, workers, result_queue))
+    process.start()
+    while True:
+        try:
+            result = result_queue.get(timeout=poll_interval)
+            break
+        except queue.Empty:
+            # A child that crashed or was killed never sends its result
+            if process.exitcode is not None:
+                try:
+                    result = result_queue.get(timeout=poll_interval)
+                    break
+                except queue.Empty:
+                    raise RuntimeError(f"{strategy} benchmark process exited with code {process.exitcode} "
+                                       "without a result")
+    process.join()
+    return result
+
+
+def format_seconds(value):
+    # Percentiles are None when no page finished
+    return 'n/a' if value is None else f"{value:.4f}s"
+
+
+def summarise(strategy, workers, result, settings):
+    latencies = sorted(latency for latency, _ in result['samples'])
+    errors = sum(1 for _, status in result['samples'] if status is None or status >= 400)
+    requests_made = len(result['samples'])
+    return {
+        'strategy': strategy,
+        'workers': workers,
+        'requests': requests_made,
+        'errors': errors,
+        'wall_time': round(result['wall_time'], 4),
+        'throughput_rps': round(requests_made / result['wall_time'], 2) if result['wall_time'] else None,
+        'latency_p50': percentile(latencies, 0.50),
+        'latency_p95': percentile(latencies, 0.95),
+        'latency_p99': percentile(latencies, 0.99),
+        'cpu_time': result['cpu_time'],
+        'peak_rss_mb': result['peak_rss_mb'],
+        'peak_child_rss_mb': result['peak_child_rss_mb'],
+        'fixture': settings,
+    }
+
+
+def run_metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': cpu_count(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark fetch strategies against a local fixture server.")
+    parser.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), default=list(STRATEGIES))
+    parser.add_argument('--workers', nargs='+', type=int, default=[16],
+                        help="worker counts to try for the concurrent strategies")
+    parser.add_argument('--pages', type=int, default=200, help="number of pages to fetch")
+    parser.add_argument('--latency', type=float, default=0.05, help="server latency per page in seconds")
+    parser.add_argument('--jitter', type=float, default=0.01, help="standard deviation of the latency")
+    parser.add_argument('--body-size', type=int, default=100 * 1024, help="page body size in bytes")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of pages answered with a 500")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', default='benchmark_results.jsonl', help="JSON lines file results are appended to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = {
+        'pages': args.pages,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'body_size': args.body_size,
+        'error_rate': args.error_rate,
+    }
+    server, base_url = start_fixture_server(settings)
+    try:
+        links = normal.get_links(f"{base_url}/list")
+        metadata = run_metadata()
+        print(f"Fixture at {base_url}: {len(links)} pages, {args.latency}s latency, {args.body_size} bytes")
+
+        with open(args.output, 'a') as output:
+            for strategy in args.strategies:
+                worker_counts = [1] if strategy == 'sequential' else args.workers
+                for workers in worker_counts:
+                    for _ in range(args.repeat):
+                        try:
+                            result = measure_strategy(strategy, links, workers)
+                        except RuntimeError as e:
+                            print(f"{strategy:>10} x{workers:<4} failed: {e}")
+                            continue
+                        summary = summarise(strategy, workers, result, settings)
+                        output.write(json.dumps({**metadata, **summary}) + '\n')
+                        output.flush()
+                        print(f"{strategy:>10} x{workers:<4} {summary['throughput_rps']:>9} req/s  "
+                              f"p50 {format_seconds(summary['latency_p50'])}  "
+                              f"p95 {format_seconds(summary['latency_p95'])}  "
+                              f"p99 {format_seconds(summary['latency_p99'])}  errors {summary['errors']}  "
+                              f"cpu {summary['cpu_time']}s  rss {summary['peak_rss_mb']} MB")
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
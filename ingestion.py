@@ -0,0 +1,292 @@
+import os
+import json
+import math
+import time
+import hashlib
+import sqlite3
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from artifact_cache import sha256_file
+from Normalize import iter_chunks
+from llm_telemetry import telemetry
+
+load_dotenv()
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.sqlite")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+INGEST_CHUNK_TOKENS = int(os.getenv("INGEST_CHUNK_TOKENS", "512"))
+INGEST_CHUNK_OVERLAP_TOKENS = int(os.getenv("INGEST_CHUNK_OVERLAP_TOKENS", "64"))
+
+
+def token_chunks(pages):
+    return iter_chunks(pages, INGEST_CHUNK_TOKENS, INGEST_CHUNK_OVERLAP_TOKENS)
+
+
+# Chunks in the artifact cache are looked up under the chunker's cache_key
+token_chunks.cache_key = f"tokens-{INGEST_CHUNK_TOKENS}-{INGEST_CHUNK_OVERLAP_TOKENS}"
+
+
+def embeddings_key(embeddings):
+    # Class and model, so vectors from another embedding model are never reused
+    model = getattr(embeddings, 'model', None) or getattr(embeddings, 'deployment', None)
+    return getattr(embeddings, 'cache_key', None) or f"{type(embeddings).__name__}:{model}"
+
+
+def chunk_id_prefix(file_path, sha256):
+    # Stable per file and content, so a changed file never reuses the IDs of its old chunks
+    return hashlib.sha1(f"{file_path}|{sha256}".encode()).hexdigest()
+
+
+# What is in the vector store: file path -> size/mtime, SHA-256 and the IDs of its chunks.
+# Files whose size and mtime are unchanged are not even hashed again.
+class IngestManifest:
+    def __init__(self, path=INGEST_MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                file_path TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                chunk_ids TEXT NOT NULL,
+                ingested_at REAL NOT NULL
+            );
+        ''')
+
+    def get(self, file_path):
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT sha256, size, mtime_ns, chunk_ids FROM files WHERE file_path = ?', (file_path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'sha256': row[0], 'size': row[1], 'mtime_ns': row[2], 'chunk_ids': json.loads(row[3])}
+
+    def set(self, file_path, sha256, size, mtime_ns, chunk_ids):
+        with self._lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files (file_path, sha256, size, mtime_ns, chunk_ids, ingested_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (file_path, sha256, size, mtime_ns, json.dumps(chunk_ids), time.time()),
+            )
+            self.connection.commit()
+
+    def remove(self, file_path):
+        with self._lock:
+            self.connection.execute('DELETE FROM files WHERE file_path = ?', (file_path,))
+            self.connection.commit()
+
+    def file_paths(self):
+        with self._lock:
+            return [row[0] for row in self.connection.execute('SELECT file_path FROM files')]
+
+    def close(self):
+        self.connection.close()
+
+
+# Stand-in for ElasticsearchStore in tests and local runs: the same add_embeddings /
+# add_texts / delete / similarity_search / as_retriever calls, with brute-force cosine
+# search over what was added. Search results are langchain Documents, as from the real store.
+class InMemoryVectorStore:
+    def __init__(self, embedding=None):
+        self.embedding = embedding
+        self.records = {}
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        text_embeddings = list(text_embeddings)
+        metadatas = metadatas or [{} for _ in text_embeddings]
+        ids = ids or [hashlib.sha1(text.encode('utf-8', errors='replace')).hexdigest() for text, _ in text_embeddings]
+        for (text, vector), metadata, record_id in zip(text_embeddings, metadatas, ids):
+            self.records[record_id] = (text, list(vector), dict(metadata))
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_embeddings(zip(texts, self.embedding.embed_documents(texts)), metadatas, ids)
+
+    def delete(self, ids=None, **kwargs):
+        for record_id in ids or []:
+            self.records.pop(record_id, None)
+        return True
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        from langchain.schema import Document
+
+        query_vector = self.embedding.embed_query(query)
+        query_norm = math.sqrt(sum(value * value for value in query_vector)) or 1
+        scored = []
+        for text, vector, metadata in self.records.values():
+            if filter and any(metadata.get(key) != value for key, value in filter.items()):
+                continue
+            norm = math.sqrt(sum(value * value for value in vector)) or 1
+            score = sum(a * b for a, b in zip(query_vector, vector)) / (norm * query_norm)
+            scored.append((score, text, metadata))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [Document(page_content=text, metadata=metadata) for _, text, metadata in scored[:k]]
+
+    def as_retriever(self, search_kwargs=None):
+        # A langchain retriever over similarity_search, so RetrievalQA accepts it like the real store's
+        from langchain.schema import BaseRetriever
+
+        store = self
+        search_kwargs = dict(search_kwargs or {})
+
+        class InMemoryRetriever(BaseRetriever):
+            def _get_relevant_documents(self, query, *, run_manager=None):
+                return store.similarity_search(query, **search_kwargs)
+
+        return InMemoryRetriever()
+
+
+def embed_in_batches(embeddings, texts, batch_size=INGEST_BATCH_SIZE, concurrency=INGEST_CONCURRENCY):
+    # embed_documents on fixed-size batches, several requests in flight, results in input order
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    model = getattr(embeddings, 'model', None) or 'embeddings'
+
+    def embed(batch):
+        # Embedding clients do not report usage, so only calls and latency are recorded
+        with telemetry.track(model, 'ingest.embed'):
+            return embeddings.embed_documents(batch)
+
+    if len(batches) <= 1 or concurrency <= 1:
+        return [vector for batch in batches for vector in embed(batch)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = executor.map(embed, batches)
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+
+def list_pdfs(directory):
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if file.lower().endswith('.pdf'):
+                yield os.path.join(root, file)
+
+
+def _chunk_records(file_path, sha256, start, window):
+    # IDs and store metadata for chunks start.. of one file
+    prefix = chunk_id_prefix(file_path, sha256)
+    ids = [f"{prefix}-{start + index}" for index in range(len(window))]
+    metadatas = [{"file_path": file_path, "sha256": sha256, "chunk": start + index,
+                  **{key: value for key, value in chunk.items() if key != 'text'}}
+                 for index, chunk in enumerate(window)]
+    return ids, metadatas
+
+
+def add_chunks(vector_store, embeddings, chunks, file_path, sha256, batch_size, concurrency,
+               artifact_cache=None, cache_keys=None):
+    # Chunks are pulled from the generator a window at a time (concurrency batches), embedded
+    # and written, so a large document is never held in memory as a whole. With an artifact
+    # cache, the chunks and vectors are also kept and saved under the PDF's SHA-256 at the end.
+    chunk_ids = []
+    cached_texts, cached_metadata, cached_vectors = [], [], []
+    chunks = iter(chunks)
+    while True:
+        window = list(islice(chunks, batch_size * concurrency))
+        if not window:
+            break
+        texts = [chunk['text'] for chunk in window]
+        vectors = embed_in_batches(embeddings, texts, batch_size, concurrency)
+        ids, metadatas = _chunk_records(file_path, sha256, len(chunk_ids), window)
+        vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        chunk_ids.extend(ids)
+        if cache_keys is not None:
+            cached_texts.extend(texts)
+            cached_metadata.extend({key: value for key, value in chunk.items() if key != 'text'} for chunk in window)
+            cached_vectors.extend(vectors)
+
+    if cache_keys is not None and cached_texts:
+        chunker_key, embedder_key = cache_keys
+        artifact_cache.put_chunks(sha256, chunker_key, cached_texts, cached_metadata)
+        artifact_cache.put_embeddings(sha256, chunker_key, embedder_key, cached_vectors)
+    return chunk_ids
+
+
+def add_cached_chunks(vector_store, artifact_cache, file_path, sha256, chunker_key, embedder_key, window_size):
+    # The same PDF bytes were chunked and embedded before, under any path or in an earlier run:
+    # the stored chunks and vectors are written as they are, and nothing is parsed or embedded.
+    # Returns None when the cache does not hold both.
+    texts = artifact_cache.get_chunks(sha256, chunker_key)
+    if texts is None:
+        return None
+    vectors = artifact_cache.get_embeddings(sha256, chunker_key, embedder_key)
+    if vectors is None or len(vectors) != len(texts):
+        return None
+    chunk_metadata = artifact_cache.get_chunk_metadata(sha256, chunker_key) or [{} for _ in texts]
+
+    chunk_ids = []
+    for start in range(0, len(texts), window_size):
+        window = [{'text': text, **metadata}
+                  for text, metadata in zip(texts[start:start + window_size], chunk_metadata[start:start + window_size])]
+        ids, metadatas = _chunk_records(file_path, sha256, start, window)
+        vector_store.add_embeddings([(chunk['text'], vector.tolist())
+                                     for chunk, vector in zip(window, vectors[start:start + window_size])],
+                                    metadatas=metadatas, ids=ids)
+        chunk_ids.extend(ids)
+    return chunk_ids
+
+
+# Bring the vector store in line with the PDFs under directory. Only new or changed files
+# are read, chunked and embedded; chunks of changed or deleted files are removed.
+# load_pages(file_path, sha256) returns the page texts of one file, and chunker turns them
+# into chunk dicts with a 'text' key; the other keys are stored as chunk metadata.
+# With an artifact cache and a chunker that has a cache_key, chunks and vectors are also
+# stored by the PDF's SHA-256, so the same bytes at another path or in another run are
+# never parsed or embedded again.
+# Returns the file path -> SHA-256 of every current file and the counts of what was done.
+def ingest_directory(directory, vector_store, embeddings, manifest, load_pages, chunker=token_chunks,
+                     batch_size=INGEST_BATCH_SIZE, concurrency=INGEST_CONCURRENCY, artifact_cache=None):
+    stats = {'unchanged': 0, 'added': 0, 'updated': 0, 'removed': 0, 'chunks_embedded': 0, 'chunks_reused': 0,
+             'chunks_deleted': 0}
+    documents = {}
+    cache_keys = None
+    if artifact_cache is not None and getattr(chunker, 'cache_key', None):
+        cache_keys = (chunker.cache_key, embeddings_key(embeddings))
+
+    for file_path in list_pdfs(directory):
+        file_stat = os.stat(file_path)
+        entry = manifest.get(file_path)
+        if entry and entry['size'] == file_stat.st_size and entry['mtime_ns'] == file_stat.st_mtime_ns:
+            documents[file_path] = entry['sha256']
+            stats['unchanged'] += 1
+            continue
+
+        sha256 = sha256_file(file_path)
+        documents[file_path] = sha256
+        if entry and entry['sha256'] == sha256:
+            # Touched but not modified
+            manifest.set(file_path, sha256, file_stat.st_size, file_stat.st_mtime_ns, entry['chunk_ids'])
+            stats['unchanged'] += 1
+            continue
+
+        chunk_ids = None
+        if cache_keys is not None:
+            chunk_ids = add_cached_chunks(vector_store, artifact_cache, file_path, sha256, *cache_keys,
+                                          batch_size * concurrency)
+        if chunk_ids is None:
+            chunk_ids = add_chunks(vector_store, embeddings, chunker(load_pages(file_path, sha256)),
+                                   file_path, sha256, batch_size, concurrency, artifact_cache, cache_keys)
+            stats['chunks_embedded'] += len(chunk_ids)
+        else:
+            stats['chunks_reused'] += len(chunk_ids)
+        # Old chunks go only once the new ones are in, so the file is never missing from the index
+        if entry and entry['chunk_ids']:
+            vector_store.delete(ids=entry['chunk_ids'])
+            stats['chunks_deleted'] += len(entry['chunk_ids'])
+        manifest.set(file_path, sha256, file_stat.st_size, file_stat.st_mtime_ns, chunk_ids)
+        stats['updated' if entry else 'added'] += 1
+
+    prefix = os.path.join(directory, '')
+    for file_path in manifest.file_paths():
+        if file_path.startswith(prefix) and file_path not in documents:
+            entry = manifest.get(file_path)
+            if entry['chunk_ids']:
+                vector_store.delete(ids=entry['chunk_ids'])
+                stats['chunks_deleted'] += len(entry['chunk_ids'])
+            manifest.remove(file_path)
+            stats['removed'] += 1
+
+    return documents, stats
@@ -0,0 +1,156 @@
+import io
+import csv
+import json
+import time
+import uuid
+import asyncio
+from collections import OrderedDict, deque
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+# One submitted PDF and its questions. Every state change is appended to events, so a
+# subscriber that connects late still replays the answers it missed.
+class Job:
+    def __init__(self, client_id, questions, mode, payload):
+        self.id = uuid.uuid4().hex
+        self.client_id = client_id
+        self.questions = questions
+        self.mode = mode
+        self.payload = payload
+        self.status = 'queued'
+        self.answers = [None] * len(questions)
+        self.errors = {}
+        self.events = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self._changed = asyncio.Condition()
+
+    async def emit(self, event, data):
+        async with self._changed:
+            self.events.append((event, data))
+            self._changed.notify_all()
+
+    async def set_answer(self, index, answer):
+        self.answers[index] = answer
+        await self.emit('answer', {'index': index, 'question': self.questions[index], 'answer': answer})
+
+    async def set_error(self, index, error):
+        self.errors[index] = error
+        await self.emit('answer_error', {'index': index, 'question': self.questions[index], 'error': error})
+
+    async def set_status(self, status, **data):
+        self.status = status
+        await self.emit(status, {'status': status, **data})
+        if self.finished:
+            self.finished_at = time.time()
+
+    @property
+    def finished(self):
+        # The terminal event is the last one, so subscribers always receive it
+        return bool(self.events) and self.events[-1][0] in ('done', 'failed')
+
+    async def iter_events(self):
+        # Replays past events, then waits for new ones until the job has finished
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.events) > position)
+                pending = self.events[position:]
+            position += len(pending)
+            for event in pending:
+                yield event
+            if self.finished and position == len(self.events):
+                return
+
+    def summary(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'questions': len(self.questions),
+            'answered': sum(answer is not None for answer in self.answers),
+            'errors': len(self.errors),
+            'answers': [{'question': question, 'answer': answer}
+                        for question, answer in zip(self.questions, self.answers)],
+        }
+
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def result_csv(job):
+    # One row per question, built in memory
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['question', 'answer'])
+    writer.writerows(zip(job.questions, job.answers))
+    return buffer.getvalue().encode('utf-8')
+
+
+def result_xlsx(job):
+    # Same layout as the synchronous endpoint (one column per question), saved to memory
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(job.questions))
+    sheet.append(list(job.answers))
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+# Bounded job queue with round-robin across clients: a client that submits many jobs
+# only gets every n-th worker slot when n clients are waiting.
+class FairJobQueue:
+    def __init__(self, max_pending=100, max_pending_per_client=10):
+        self.max_pending = max_pending
+        self.max_pending_per_client = max_pending_per_client
+        self.pending = OrderedDict()  # client_id -> deque of jobs, in round-robin order
+        self.size = 0
+        self._available = asyncio.Condition()
+
+    async def put(self, job):
+        async with self._available:
+            client_jobs = self.pending.get(job.client_id)
+            if self.size >= self.max_pending:
+                raise JobQueueFull("The job queue is full")
+            if client_jobs is not None and len(client_jobs) >= self.max_pending_per_client:
+                raise JobQueueFull(f"Client {job.client_id} already has {len(client_jobs)} queued jobs")
+            self.pending.setdefault(job.client_id, deque()).append(job)
+            self.size += 1
+            self._available.notify()
+
+    async def get(self):
+        async with self._available:
+            await self._available.wait_for(lambda: self.size > 0)
+            client_id, client_jobs = self.pending.popitem(last=False)
+            job = client_jobs.popleft()
+            if client_jobs:
+                # The client goes to the back of the line
+                self.pending[client_id] = client_jobs
+            self.size -= 1
+            return job
+
+
+# Jobs by ID. Finished jobs are kept for ttl_seconds so their results can be fetched.
+class JobStore:
+    def __init__(self, ttl_seconds=3600):
+        self.ttl_seconds = ttl_seconds
+        self.jobs = {}
+
+    def add(self, job):
+        self.prune()
+        self.jobs[job.id] = job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def prune(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.ttl_seconds]:
+            del self.jobs[job_id]
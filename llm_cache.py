@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from dotenv import load_dotenv
+from llm_telemetry import telemetry, usage_tokens
+
+load_dotenv()
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+
+
+def schema_of(result_type):
+    if result_type is None:
+        return None
+    if hasattr(result_type, 'model_json_schema'):
+        return result_type.model_json_schema()
+    return repr(result_type)
+
+
+# On-disk cache of model responses shared by the agent-based services. Entries expire
+# after ttl_seconds, and the least recently used ones are evicted once the store
+# grows past max_bytes.
+class LLMCache:
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+                 ttl_seconds=LLM_CACHE_TTL_HOURS * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at);
+            CREATE INDEX IF NOT EXISTS entries_created ON entries (created_at);
+        ''')
+        self.total_bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    @staticmethod
+    def make_key(model, system_prompt, prompt, result_schema=None, **extra):
+        # Everything that can change the answer is part of the key
+        material = json.dumps({
+            'model': model,
+            'system_prompt': system_prompt,
+            'prompt_sha256': hashlib.sha256(prompt.encode('utf-8', errors='replace')).hexdigest(),
+            'schema': result_schema,
+            'extra': extra,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute('SELECT value, created_at, size FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.connection.commit()
+                self.total_bytes -= row[2]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.connection.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+            self.connection.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        encoded = json.dumps(value, default=str)
+        size = len(encoded)
+        now = time.time()
+        with self._lock:
+            previous = self.connection.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            self.connection.execute(
+                'INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, encoded, size, now, now),
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        # Expired entries first, then least recently used until the store fits
+        expired = self.connection.execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries WHERE created_at < ?',
+                                          (time.time() - self.ttl_seconds,)).fetchone()
+        if expired[1]:
+            self.connection.execute('DELETE FROM entries WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+            self.total_bytes -= expired[0]
+            self.evictions += expired[1]
+        while self.total_bytes > self.max_bytes:
+            rows = self.connection.execute('SELECT key, size FROM entries ORDER BY accessed_at LIMIT 100').fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.total_bytes -= size
+                self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'evictions': self.evictions,
+            'bytes': self.total_bytes,
+        }
+
+    def get_or_call(self, key, call):
+        # Synchronous helper for non-agent call sites such as a LangChain chain
+        value = self.get(key)
+        if value is None:
+            value = call()
+            self.set(key, value)
+        return value
+
+    def close(self):
+        self.connection.close()
+
+
+# Spaces model calls at most calls_per_minute apart across every thread and task that
+# shares it. wait() blocks a worker thread; acquire() is the same for coroutines.
+class RateLimiter:
+    def __init__(self, calls_per_minute):
+        self.interval = 60.0 / calls_per_minute if calls_per_minute else 0.0
+        self.next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+            return slot - now
+
+    def wait(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class CachedResult:
+    # Same shape as a pydantic-ai run result for the attributes the services read
+    def __init__(self, data):
+        self.data = data
+
+
+# Drop-in wrapper around a pydantic-ai Agent: run/run_sync return the cached result
+# when the model, system prompt, prompt and result schema have been seen before.
+# With a rate limiter, only calls that reach the model wait for a slot. Every call,
+# cached or not, is recorded in the LLM telemetry under call_site (or the endpoint label).
+class CachedAgent:
+    def __init__(self, agent, cache, model_name, system_prompt, result_type=None, rate_limiter=None, call_site=None):
+        self.agent = agent
+        self.cache = cache
+        self.model_name = model_name
+        self.system_prompt = system_prompt
+        self.result_type = result_type
+        self.result_schema = schema_of(result_type)
+        self.rate_limiter = rate_limiter
+        self.call_site = call_site
+
+    def _key(self, prompt, kwargs):
+        return self.cache.make_key(self.model_name, self.system_prompt, prompt, self.result_schema, **kwargs)
+
+    def _load(self, value):
+        if self.result_type is not None and hasattr(self.result_type, 'model_validate'):
+            return CachedResult(self.result_type.model_validate(value))
+        return CachedResult(value)
+
+    @staticmethod
+    def _dump(data):
+        return data.model_dump(mode='json') if hasattr(data, 'model_dump') else data
+
+    async def run(self, prompt, **kwargs):
+        # The SQLite reads and writes (each a commit) run in a worker thread, off the event loop
+        key = self._key(prompt, kwargs)
+        value = await asyncio.to_thread(self.cache.get, key)
+        if value is not None:
+            telemetry.record(self.model_name, 0.0, cached=True, endpoint=self.call_site)
+            return self._load(value)
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+        with telemetry.track(self.model_name, self.call_site) as call:
+            result = await self.agent.run(prompt, **kwargs)
+            call.input_tokens, call.output_tokens = usage_tokens(result)
+        await asyncio.to_thread(self.cache.set, key, self._dump(result.data))
+        return result
+
+    def run_sync(self, prompt, **kwargs):
+        key = self._key(prompt, kwargs)
+        value = self.cache.get(key)
+        if value is not None:
+            telemetry.record(self.model_name, 0.0, cached=True, endpoint=self.call_site)
+            return self._load(value)
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        with telemetry.track(self.model_name, self.call_site) as call:
+            result = self.agent.run_sync(prompt, **kwargs)
+            call.input_tokens, call.output_tokens = usage_tokens(result)
+        self.cache.set(key, self._dump(result.data))
+        return result
@@ -0,0 +1,280 @@
+import os
+import re
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+LLM_PRICING_FILE = os.getenv("LLM_PRICING_FILE")
+LLM_TELEMETRY_SUMMARY = os.getenv("LLM_TELEMETRY_SUMMARY", "llm_telemetry_summary.json")
+
+# USD per million tokens (input, output), from the pricing table in Readme.html plus GPT-4.
+# LLM_PRICING_FILE can point to a JSON file {"model": [input, output]} to override or extend it.
+# Models listed there without a public price (o1-mini, o3-mini) are left out and counted as unpriced.
+DEFAULT_PRICING = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (5.00, 15.00),
+    'gpt-4': (30.00, 60.00),
+    'o1': (15.00, 60.00),
+}
+
+# A dated snapshot prices as its model: gpt-4o-2024-08-06, gpt-4-0613
+_DATE_SUFFIX = r"(-\d{4}(-\d{2}-\d{2})?)?"
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+# Who a model call is for: endpoint, document and question, set by the caller and
+# inherited by everything it awaits (asyncio tasks copy the context when created)
+_labels = contextvars.ContextVar('llm_labels', default={})
+
+
+def load_pricing(path=LLM_PRICING_FILE):
+    pricing = dict(DEFAULT_PRICING)
+    if path:
+        with open(path, 'r', encoding='utf-8') as file:
+            pricing.update({model.lower(): tuple(prices) for model, prices in json.load(file).items()})
+    return pricing
+
+
+def normalize_model(model):
+    # "openai:gpt-4", "azure/gpt-4o" and "gpt-4o" are the same model for pricing
+    model = (model or 'unknown').lower()
+    for separator in (':', '/'):
+        model = model.rsplit(separator, 1)[-1]
+    return model
+
+
+def usage_tokens(result):
+    # (input, output) tokens of a pydantic-ai run result, across the old and new Usage field names
+    usage = result.usage() if callable(getattr(result, 'usage', None)) else getattr(result, 'usage', None)
+    if usage is None:
+        return 0, 0
+    input_tokens = getattr(usage, 'input_tokens', None) or getattr(usage, 'request_tokens', None) or 0
+    output_tokens = getattr(usage, 'output_tokens', None) or getattr(usage, 'response_tokens', None) or 0
+    return input_tokens, output_tokens
+
+
+@contextmanager
+def labels(**values):
+    token = _labels.set({**_labels.get(), **{key: value for key, value in values.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def current_labels():
+    return _labels.get()
+
+
+class _Stats:
+    __slots__ = ('calls', 'errors', 'cache_hits', 'retries', 'unpriced', 'input_tokens', 'output_tokens', 'cost',
+                 'latency_sum', 'latency_max')
+
+    def __init__(self):
+        self.calls = self.errors = self.cache_hits = self.retries = self.unpriced = 0
+        self.input_tokens = self.output_tokens = 0
+        self.cost = self.latency_sum = self.latency_max = 0.0
+
+    def as_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        # null when nothing recorded here had a known price
+        data['cost'] = round(self.cost, 6) if self.cost or not self.unpriced else None
+        data['latency_mean'] = self.latency_sum / self.calls if self.calls else None
+        return data
+
+
+class _Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+# Process-wide record of every model call: tokens, latency, retries, cache hits and
+# estimated cost, broken down by endpoint and model and attributed to documents and
+# questions. Exposed as Prometheus text and as a JSON summary.
+class LLMTelemetry:
+    def __init__(self, pricing=None, max_tracked_keys=10000):
+        self.pricing = pricing if pricing is not None else load_pricing()
+        self.max_tracked_keys = max_tracked_keys
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.by_endpoint = {}
+        self.latency = {}
+        self.by_document = {}
+        self.by_question = {}
+
+    def cost(self, model, input_tokens, output_tokens):
+        # None for a model without a known price, so it is counted as unpriced rather than free
+        model = normalize_model(model)
+        for name, (input_price, output_price) in self.pricing.items():
+            if re.fullmatch(re.escape(name) + _DATE_SUFFIX, model):
+                return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+        return None
+
+    def _tracked(self, table, key):
+        stats = table.get(key)
+        if stats is None:
+            if len(table) >= self.max_tracked_keys:
+                key = '(other)'
+                stats = table.get(key)
+            if stats is None:
+                stats = table[key] = _Stats()
+        return stats
+
+    def record(self, model, latency, input_tokens=0, output_tokens=0, cached=False, error=False, endpoint=None):
+        context = current_labels()
+        endpoint = endpoint or context.get('endpoint', 'unknown')
+        model = normalize_model(model)
+        cost = 0.0 if cached else self.cost(model, input_tokens, output_tokens)
+        with self._lock:
+            targets = [self._tracked(self.by_endpoint, (endpoint, model))]
+            if context.get('document'):
+                targets.append(self._tracked(self.by_document, context['document']))
+            if context.get('question'):
+                targets.append(self._tracked(self.by_question, context['question']))
+            for stats in targets:
+                stats.calls += 1
+                stats.errors += bool(error)
+                stats.cache_hits += bool(cached)
+                stats.input_tokens += input_tokens
+                stats.output_tokens += output_tokens
+                if cost is None:
+                    stats.unpriced += 1
+                else:
+                    stats.cost += cost
+                stats.latency_sum += latency
+                stats.latency_max = max(stats.latency_max, latency)
+            if not cached:
+                self.latency.setdefault(endpoint, _Histogram()).observe(latency)
+
+    def add_usage(self, model, input_tokens, output_tokens, endpoint=None):
+        # Tokens reported in aggregate by a library (for example crawl4ai's LLM strategies), not tied to one call
+        endpoint = endpoint or current_labels().get('endpoint', 'unknown')
+        model = normalize_model(model)
+        with self._lock:
+            stats = self._tracked(self.by_endpoint, (endpoint, model))
+            stats.input_tokens += input_tokens
+            stats.output_tokens += output_tokens
+            cost = self.cost(model, input_tokens, output_tokens)
+            if cost is None:
+                stats.unpriced += 1
+            else:
+                stats.cost += cost
+
+    def record_retry(self, model, endpoint=None):
+        endpoint = endpoint or current_labels().get('endpoint', 'unknown')
+        with self._lock:
+            self._tracked(self.by_endpoint, (endpoint, normalize_model(model))).retries += 1
+
+    @contextmanager
+    def track(self, model, endpoint=None):
+        # Times the block as one model call; set call.input_tokens/output_tokens inside it when known
+        call = _Call()
+        start = time.perf_counter()
+        try:
+            yield call
+        except BaseException:
+            self.record(model, time.perf_counter() - start, call.input_tokens, call.output_tokens,
+                        error=True, endpoint=endpoint)
+            raise
+        self.record(model, time.perf_counter() - start, call.input_tokens, call.output_tokens,
+                    cached=call.cached, endpoint=endpoint)
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            metrics = [
+                ('llm_calls_total', 'counter', 'Model calls, including cache hits', 'calls'),
+                ('llm_errors_total', 'counter', 'Model calls that failed', 'errors'),
+                ('llm_cache_hits_total', 'counter', 'Calls answered from the response cache', 'cache_hits'),
+                ('llm_retries_total', 'counter', 'Retried model calls', 'retries'),
+                ('llm_unpriced_total', 'counter', 'Calls and usage reports for models without a known price',
+                 'unpriced'),
+                ('llm_input_tokens_total', 'counter', 'Prompt tokens', 'input_tokens'),
+                ('llm_output_tokens_total', 'counter', 'Completion tokens', 'output_tokens'),
+                ('llm_cost_usd_total', 'counter', 'Estimated cost in USD', 'cost'),
+            ]
+            for name, kind, help_text, field in metrics:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (endpoint, model), stats in sorted(self.by_endpoint.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}",model="{model}"}} {getattr(stats, field)}')
+            lines.append("# HELP llm_latency_seconds Latency of model calls that reached the model")
+            lines.append("# TYPE llm_latency_seconds histogram")
+            for endpoint, histogram in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f'llm_latency_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'llm_latency_seconds_sum{{endpoint="{endpoint}"}} {histogram.sum}')
+                lines.append(f'llm_latency_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, top=20):
+        with self._lock:
+            def ranked(table, key):
+                items = sorted(table.items(), key=lambda item: getattr(item[1], key), reverse=True)[:top]
+                return [{'key': name, **stats.as_dict()} for name, stats in items]
+
+            return {
+                'started_at': self.started_at,
+                'duration': time.time() - self.started_at,
+                'totals': {
+                    'calls': sum(stats.calls for stats in self.by_endpoint.values()),
+                    'input_tokens': sum(stats.input_tokens for stats in self.by_endpoint.values()),
+                    'output_tokens': sum(stats.output_tokens for stats in self.by_endpoint.values()),
+                    'cost': round(sum(stats.cost for stats in self.by_endpoint.values()), 6),
+                    'unpriced': sum(stats.unpriced for stats in self.by_endpoint.values()),
+                },
+                'endpoints': [{'endpoint': endpoint, 'model': model, **stats.as_dict()}
+                              for (endpoint, model), stats in sorted(self.by_endpoint.items())],
+                'latency': {endpoint: {'count': histogram.count, 'p50': histogram.quantile(0.5),
+                                       'p95': histogram.quantile(0.95), 'p99': histogram.quantile(0.99)}
+                            for endpoint, histogram in self.latency.items()},
+                'documents_by_cost': ranked(self.by_document, 'cost'),
+                'questions_by_cost': ranked(self.by_question, 'cost'),
+                'questions_by_latency': ranked(self.by_question, 'latency_max'),
+            }
+
+    def write_summary(self, path=LLM_TELEMETRY_SUMMARY):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.summary(), file, indent=2, default=str)
+
+
+class _Call:
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached = False
+
+
+# Shared by every call site in the process
+telemetry = LLMTelemetry()
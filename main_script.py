@@ -1,16 +1,77 @@
+import argparse
 import asyncio
+import json
 import time
-import pandas as pd
 import os
-from concurrent.futures import ThreadPoolExecutor
 from pdf_scraper.scraper import scrape_website
+from pdf_scraper.browser_pool import BrowserPool
+from pdf_scraper.downloader import PdfDownloader
+from pdf_scraper.store import PdfStore
+from pdf_scraper.static_fetch import FetchTiers
+from pdf_scraper.resource_filter import ResourceFilter
 from pdf_scraper.utils import read_websites_from_file, read_config_from_file
-from pdf_scraper.database import save_to_sql_server
+from pdf_scraper.database import MetadataSink
+from pdf_scraper.journal import RunJournal
+from pdf_scraper.writers import create_writers, export_excel, read_jsonl, JsonlWriter, DEFAULT_FIELDS
+from pdf_scraper.tracing import Tracer, get_tracer, set_tracer, profiled
 
-def wrapper(task):
-    return asyncio.run(task)
+async def scrape_all(websites, download_folder, config, sink, journal, writers):
+    # Bound the number of sites in flight; pages themselves are bounded by the pool
+    semaphore = asyncio.Semaphore(config.get("max_concurrent_sites", 50))
+    tracer = get_tracer()
 
-def main():
+    # The store's manifest and the per-domain fetch tiers persist between runs
+    store = PdfStore(download_folder)
+    tiers = FetchTiers(os.path.join(download_folder, config.get("tier_file", "fetch_tiers.json")))
+    fetch_mode = config.get("fetch_mode", "auto")
+    resource_filter = ResourceFilter.from_config(config)
+    try:
+        async with BrowserPool.from_config(config) as pool, PdfDownloader.from_config(config) as downloader:
+            async def scrape_one(website):
+                async with semaphore:
+                    pdf_metadata_list = await scrape_website(
+                        website, download_folder, pool, downloader, store, config.get("link_rules"), tiers, fetch_mode,
+                        resource_filter, journal
+                    )
+                # Hand the site's records to the outputs and the database as soon as it finishes
+                with tracer.span('write_outputs', website, records=len(pdf_metadata_list)):
+                    for writer in writers:
+                        writer.write_many(pdf_metadata_list)
+                with tracer.span('db_insert', website, records=len(pdf_metadata_list)):
+                    await asyncio.to_thread(sink.add_many, pdf_metadata_list)
+
+            await asyncio.gather(*(scrape_one(website) for website in websites))
+
+            # Report the domains that had to be throttled
+            for domain, state in downloader.scheduler.snapshot().items():
+                if state['backoffs']:
+                    print(f"Throttled {domain}: {state}")
+    finally:
+        tiers.save()
+        store.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape PDF links and metadata from the configured websites.")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip sites the journal already completed and retry only the failures")
+    parser.add_argument('--journal', default=None, help="path of the run journal (overrides config.json)")
+    parser.add_argument('--trace', action='store_true',
+                        help="record timing spans per stage, site and link and write a report (see \"tracing\" in config.json)")
+    parser.add_argument('--profile', action='store_true', help="with --trace, also run the crawl under cProfile")
+    parser.add_argument('--trace-memory', action='store_true', help="with --trace, also capture tracemalloc statistics")
+    return parser.parse_args(argv)
+
+def write_trace_report(tracer, profile_results, options):
+    report = tracer.report(options.get("top", 20))
+    report.update(profile_results)
+    with open(options.get("report_file", "trace_report.json"), 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, default=str)
+    print(f"Trace report written to {options.get('report_file', 'trace_report.json')}")
+    for stage in report['stages'][:5]:
+        print(f"  {stage['stage']}: {stage['total']}s over {stage['count']} spans ({stage['errors']} errors)")
+
+def main(argv=None):
+    args = parse_args(argv)
     print("Start", time.ctime())
 
     # Load configuration from the file
@@ -19,30 +80,75 @@ def main():
     # List of websites to scrape
     websites = read_websites_from_file(config["websites_file"])
 
-    # Set the maximum number of threads to use
-    max_threads = config["max_threads"]
-
     # Specify the folder to save the PDF files
     download_folder = 'pdf_files'
 
     # Create the download folder if it doesn't exist
     os.makedirs(download_folder, exist_ok=True)
 
-    # Create a ThreadPoolExecutor with the specified maximum number of threads
-    with ThreadPoolExecutor(max_threads) as executor:
-        tasks = [scrape_website(website, download_folder) for website in websites]
-        results = executor.map(wrapper, tasks)
+    # Opt-in instrumentation: spans and counters for every stage, optionally cProfile/tracemalloc
+    trace_options = config.get("tracing", {})
+    tracing = args.trace or trace_options.get("enabled", False)
+    tracer = Tracer(trace_options.get("events_file")) if tracing else None
+    set_tracer(tracer)
+    profile_file = None
+    if tracing and (args.profile or trace_options.get("cprofile", False)):
+        profile_file = trace_options.get("cprofile_file", "crawl.prof")
+    trace_memory = tracing and (args.trace_memory or trace_options.get("tracemalloc", False))
 
-    # Flatten the list of lists into a single list of dictionaries
-    pdf_metadata_list = [item for sublist in results for item in sublist]
+    # Every finished site is journalled; a resumed run only does what is left
+    journal = RunJournal(args.journal or config.get("journal_file", "crawl_journal.sqlite"))
+    outputs = config.get("outputs", {})
+    writers = create_writers(outputs)
+    # Set before anything can fail, so the trace report in finally never hides the real error
+    profile_results = {}
+    try:
+        if args.resume:
+            completed = journal.completed_sites()
+            failed = journal.failed_sites()
+            websites = [website for website in websites if website not in completed]
+            print(f"Resuming: {len(completed)} sites done, {len(failed)} to retry, {len(websites)} left")
 
-    # Create a pandas DataFrame from the list of dictionaries
-    df = pd.DataFrame(pdf_metadata_list)
+            # Carry the records of the resumed run into the fresh output files
+            batch = []
+            for metadata in journal.records(completed_only=True):
+                batch.append(metadata)
+                if len(batch) == 1000:
+                    for writer in writers:
+                        writer.write_many(batch)
+                    batch = []
+            for writer in writers:
+                writer.write_many(batch)
+        else:
+            journal.reset()
 
-    # Save the DataFrame to an Excel file
-    df.to_excel('pdf_metadata.xlsx', index=False)    
+        # Scrape every site on a single event loop sharing one browser pool,
+        # streaming records to the outputs and the database as sites finish
+        with profiled(profile_file, trace_memory, trace_options.get("top", 20)) as profile_results:
+            with MetadataSink.from_config(config) as sink:
+                asyncio.run(scrape_all(websites, download_folder, config, sink, journal, writers))
+                with get_tracer().span('db_flush'):
+                    sink.flush()
+            if sink.failed:
+                print(f"{len(sink.failed)} records could not be written to the database:")
+                for metadata, error in sink.failed:
+                    print(f"  {metadata['url']}: {error}")
 
-    save_to_sql_server(pdf_metadata_list)  
+            # Optional Excel export, generated from the streamed JSONL file (or the journal) rather than from memory
+            if outputs.get("excel", True):
+                jsonl_writer = next((writer for writer in writers if isinstance(writer, JsonlWriter)), None)
+                records = read_jsonl(jsonl_writer.path) if jsonl_writer is not None else journal.records()
+                with get_tracer().span('excel_export'):
+                    export_excel(records, outputs.get("excel_file", "pdf_metadata.xlsx"),
+                                 tuple(outputs.get("fields", DEFAULT_FIELDS)))
+    finally:
+        for writer in writers:
+            writer.close()
+        journal.close()
+        if tracer is not None:
+            write_trace_report(tracer, profile_results, trace_options)
+            tracer.close()
+            set_tracer(None)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
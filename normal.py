@@ -1,9 +1,13 @@
+import os
 import time
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
-def get_links():
-    countries_list = 'https://en.wikipedia.org/wiki/List_of_countries_by_population_(United_Nations)'
+
+COUNTRIES_LIST = 'https://en.wikipedia.org/wiki/List_of_countries_by_population_(United_Nations)'
+OUTPUT_FOLDER = 'contentHtmls'
+
+def get_links(countries_list=COUNTRIES_LIST):
     all_links = []
     response = requests.get(countries_list)
     soup = BeautifulSoup( response.text, "lxml")
@@ -14,11 +18,13 @@ def get_links():
         all_links.append(link)
     return all_links
 
-def fetch(link):
+def fetch(link, output_folder=OUTPUT_FOLDER):
     response = requests.get(link)
-    with open("C:\\python\\ConcurrencyvsParallelism\\contentHtmls\\"+link.split("/")[-1]+".html","wb") as f:
+    with open(os.path.join(output_folder, link.split("/")[-1]+".html"),"wb") as f:
         f.write(response.content)
+    return response.status_code
 if __name__ == '__main__':
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
     links = get_links()
     print(f'Total page: {len(links)}')
     start_time= time.time()
@@ -26,4 +32,4 @@ if __name__ == '__main__':
     for link in links:
         fetch(link)
     duration = time.time() - start_time
-    print(f'Dowmloaded {len(links)} links in {duration} seconds')
\ No newline at end of file
+    print(f'Dowmloaded {len(links)} links in {duration} seconds')
@@ -1,25 +1,9 @@
 from multiprocessing import Pool, cpu_count
+import os
 import time
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-def get_links():
-    countries_list = 'https://en.wikipedia.org/wiki/List_of_countries_by_population_(United_Nations)'
-    all_links = []
-    response = requests.get(countries_list)
-    soup = BeautifulSoup( response.text, "lxml")
-    countries_el = soup.select('td .flagicon+ a')
-    for link_el in countries_el:
-        link = link_el.get("href")
-        link = urljoin(countries_list, link)
-        all_links.append(link)
-    return all_links
-
-def fetch(link):
-    response = requests.get(link)
-    with open("C:\\python\\ConcurrencyvsParallelism\\contentHtmls\\"+link.split("/")[-1]+".html","wb") as f:
-        f.write(response.content)
+from normal import get_links, fetch, OUTPUT_FOLDER
 if __name__ == '__main__':
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
     links = get_links()
     print(f'Total page: {len(links)}')
     start_time= time.time()
@@ -27,4 +11,4 @@ if __name__ == '__main__':
     with Pool(cpu_count()) as p:
         p.map(fetch,links)
     duration = time.time() - start_time
-    print(f'Dowmloaded {len(links)} links in {duration} seconds')
\ No newline at end of file
+    print(f'Dowmloaded {len(links)} links in {duration} seconds')
@@ -0,0 +1,127 @@
+import asyncio
+from contextlib import asynccontextmanager
+from pyppeteer import launch
+from pdf_scraper.tracing import get_tracer
+
+
+class _BrowserSlot:
+    def __init__(self, browser):
+        self.browser = browser
+        self.active = 0
+        self.served = 0
+        self.retiring = False
+        self.crashed = False
+
+
+# Fixed number of long-lived Chromium processes shared by every site on one event loop.
+# Pages are handed out with `async with pool.page() as page`. A browser is retired once
+# it has served `recycle_after_pages` pages or after it crashes, and a fresh one is
+# launched in its place.
+class BrowserPool:
+    def __init__(self, browsers=2, pages_per_browser=10, recycle_after_pages=100,
+                 incognito=True, launch_options=None):
+        self.browsers = browsers
+        self.pages_per_browser = pages_per_browser
+        self.recycle_after_pages = recycle_after_pages
+        self.incognito = incognito
+        self.launch_options = launch_options or {}
+        self._slots = []
+        self._lock = asyncio.Lock()
+        self._pages = asyncio.Semaphore(browsers * pages_per_browser)
+        self.launched = 0
+
+    @classmethod
+    def from_config(cls, config):
+        # Build a pool from the "browser_pool" section of config.json
+        options = config.get("browser_pool", {})
+        return cls(
+            browsers=options.get("browsers", 2),
+            pages_per_browser=options.get("pages_per_browser", 10),
+            recycle_after_pages=options.get("recycle_after_pages", 100),
+            incognito=options.get("incognito", True),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _launch(self):
+        # Signal handlers must stay off: the pool shares the loop with the rest of the crawl
+        with get_tracer().span('browser_launch'):
+            browser = await launch(
+                handleSIGINT=False,
+                handleSIGTERM=False,
+                handleSIGHUP=False,
+                **self.launch_options
+            )
+        slot = _BrowserSlot(browser)
+        browser.on('disconnected', lambda: self._mark_crashed(slot))
+        self._slots.append(slot)
+        self.launched += 1
+        return slot
+
+    def _mark_crashed(self, slot):
+        slot.crashed = True
+        slot.retiring = True
+
+    async def _acquire_slot(self):
+        async with self._lock:
+            # Top the pool back up if browsers were retired or crashed
+            live = [s for s in self._slots if not s.retiring]
+            while len(live) < self.browsers:
+                live.append(await self._launch())
+
+            slot = min(live, key=lambda s: s.active)
+            slot.active += 1
+            slot.served += 1
+            if slot.served >= self.recycle_after_pages:
+                slot.retiring = True
+            return slot
+
+    async def _release_slot(self, slot):
+        slot.active -= 1
+        if slot.retiring and slot.active == 0 and slot in self._slots:
+            self._slots.remove(slot)
+            await self._close_browser(slot)
+
+    async def _close_browser(self, slot):
+        try:
+            await slot.browser.close()
+        except Exception as e:
+            if not slot.crashed:
+                print(f"Error while closing browser: {e}")
+
+    @asynccontextmanager
+    async def page(self):
+        async with self._pages:
+            slot = await self._acquire_slot()
+            context = None
+            page = None
+            try:
+                try:
+                    if self.incognito:
+                        context = await slot.browser.createIncognitoBrowserContext()
+                        page = await context.newPage()
+                    else:
+                        page = await slot.browser.newPage()
+                except Exception:
+                    # A browser that cannot open a page is treated as crashed
+                    self._mark_crashed(slot)
+                    raise
+                yield page
+            finally:
+                try:
+                    if context is not None:
+                        await context.close()
+                    elif page is not None:
+                        await page.close()
+                except Exception:
+                    self._mark_crashed(slot)
+                await self._release_slot(slot)
+
+    async def close(self):
+        slots, self._slots = self._slots, []
+        for slot in slots:
+            await self._close_browser(slot)
@@ -1,33 +1,149 @@
-import pandas as pd
-import pyodbc
-
-def save_to_sql_server(pdf_metadata_list):
-    # Create a pandas DataFrame from the list of dictionaries
-    df = pd.DataFrame(pdf_metadata_list)
-
-    # Connect to the SQL Server database
-    # connection_string = "DRIVER={SQL Server};SERVER=HP\\SQLEXPRESS;DATABASE=your_database;UID=your_username;PWD=your_password"
-    connection_string = "DRIVER={SQL Server};SERVER=HP\\SQLEXPRESS;DATABASE=Product;Trusted_Connection=yes"
-    connection = pyodbc.connect(connection_string)
-
-    try:
-        # Create a cursor object to interact with the database
-        cursor = connection.cursor()
-
-        # Iterate over the list of dictionaries and insert data into the table
-        for metadata in pdf_metadata_list:
-            # Customize this INSERT statement based on your table structure
-            insert_query = f"INSERT INTO pdf_metadata (url, title) VALUES (?, ?)"
-            cursor.execute(insert_query, metadata['url'], metadata['title'])
-
-        # Commit the changes to the database
-        connection.commit()
-
-    except Exception as e:
-        # Handle exceptions, if any
-        print(f"Error while inserting data into the database: {e}")
-
-    finally:
-        # Close the cursor and the database connection
-        cursor.close()
-        connection.close()  
\ No newline at end of file
+import sqlite3
+import threading
+
+DEFAULT_CONNECTION_STRING = "DRIVER={SQL Server};SERVER=HP\\SQLEXPRESS;DATABASE=Product;Trusted_Connection=yes"
+DEFAULT_COLUMNS = ('url', 'title')
+
+
+# SQL Server backend: one parameterised MERGE sent with fast_executemany, so a whole
+# batch is upserted on url in a single round-trip
+class SqlServerBackend:
+    def __init__(self, connection_string=DEFAULT_CONNECTION_STRING, table='pdf_metadata', columns=DEFAULT_COLUMNS):
+        import pyodbc
+
+        self.table = table
+        self.columns = tuple(columns)
+        self.connection = pyodbc.connect(connection_string)
+        self.cursor = self.connection.cursor()
+        self.cursor.fast_executemany = True
+
+        source = ', '.join(f"? AS {column}" for column in self.columns)
+        updates = ', '.join(f"target.{column} = source.{column}" for column in self.columns if column != 'url')
+        names = ', '.join(self.columns)
+        values = ', '.join(f"source.{column}" for column in self.columns)
+        self.upsert_query = (
+            f"MERGE {table} AS target USING (SELECT {source}) AS source ON target.url = source.url "
+            + (f"WHEN MATCHED THEN UPDATE SET {updates} " if updates else "")
+            + f"WHEN NOT MATCHED THEN INSERT ({names}) VALUES ({values});"
+        )
+
+    def write_batch(self, rows):
+        self.cursor.executemany(self.upsert_query, rows)
+        self.connection.commit()
+
+    def close(self):
+        self.cursor.close()
+        self.connection.close()
+
+
+# SQLite backend with the same interface, for local runs, tests and benchmarks
+class SqliteBackend:
+    def __init__(self, path='pdf_metadata.sqlite', table='pdf_metadata', columns=DEFAULT_COLUMNS):
+        self.table = table
+        self.columns = tuple(columns)
+        # The sink may flush from a worker thread, and it serialises access itself
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+
+        definitions = ', '.join('url TEXT PRIMARY KEY' if column == 'url' else f"{column}" for column in self.columns)
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {table} ({definitions})")
+        self.connection.commit()
+
+        names = ', '.join(self.columns)
+        placeholders = ', '.join('?' for _ in self.columns)
+        updates = ', '.join(f"{column} = excluded.{column}" for column in self.columns if column != 'url')
+        self.upsert_query = (
+            f"INSERT INTO {table} ({names}) VALUES ({placeholders}) ON CONFLICT(url) DO "
+            + (f"UPDATE SET {updates}" if updates else "NOTHING")
+        )
+
+    def write_batch(self, rows):
+        with self.connection:
+            self.connection.executemany(self.upsert_query, rows)
+
+    def close(self):
+        self.connection.close()
+
+
+def create_backend(options):
+    # Pick the backend named in the "database" section of config.json
+    backend = options.get("backend", "sqlserver")
+    columns = options.get("columns", DEFAULT_COLUMNS)
+    table = options.get("table", "pdf_metadata")
+    if backend == "sqlserver":
+        return SqlServerBackend(options.get("connection_string", DEFAULT_CONNECTION_STRING), table, columns)
+    if backend == "sqlite":
+        return SqliteBackend(options.get("path", "pdf_metadata.sqlite"), table, columns)
+    raise ValueError(f"Unknown database backend: {backend}")
+
+
+# Buffers metadata records as they arrive and upserts them in batches of batch_size.
+# Records with the same url inside one batch collapse to the latest one. Records that
+# still fail after a retry and a row-by-row fallback are kept in failed.
+class MetadataSink:
+    def __init__(self, backend, batch_size=1000):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.pending = {}
+        self.written = 0
+        self.failed = []  # (metadata, error) of records that could not be written
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        options = config.get("database", {})
+        return cls(create_backend(options), options.get("batch_size", 1000))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, metadata):
+        self.add_many([metadata])
+
+    def add_many(self, pdf_metadata_list):
+        with self._lock:
+            for metadata in pdf_metadata_list:
+                self.pending[metadata['url']] = metadata
+                if len(self.pending) >= self.batch_size:
+                    self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        records = list(self.pending.values())
+        rows = [tuple(metadata.get(column) for column in self.backend.columns) for metadata in records]
+        # One retry for a transient error, then row by row so a single bad record only loses itself
+        for attempt in range(2):
+            try:
+                self.backend.write_batch(rows)
+                self.written += len(rows)
+                self.pending = {}
+                return
+            except Exception as e:
+                print(f"Error while inserting a batch of {len(rows)} records into the database "
+                      f"(attempt {attempt + 1}): {e}")
+        for metadata, row in zip(records, rows):
+            try:
+                self.backend.write_batch([row])
+                self.written += 1
+            except Exception as e:
+                print(f"Error while inserting {metadata['url']} into the database: {e}")
+                self.failed.append((metadata, str(e)))
+        self.pending = {}
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.backend.close()
+
+
+def save_to_sql_server(pdf_metadata_list, batch_size=1000):
+    with MetadataSink(SqlServerBackend(), batch_size) as sink:
+        sink.add_many(pdf_metadata_list)
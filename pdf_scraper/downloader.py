@@ -0,0 +1,129 @@
+import os
+import asyncio
+import hashlib
+import aiohttp
+from contextlib import asynccontextmanager
+from pdf_scraper.scheduler import DomainScheduler, BACKOFF_STATUSES
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+)
+
+
+# Async PDF download engine. One aiohttp session keeps pooled keep-alive connections
+# per host, the connector enforces the global and per-host ceilings, the scheduler
+# adapts each domain's concurrency and rate below them, and bodies are streamed to
+# disk in chunks so memory stays flat regardless of file size.
+class PdfDownloader:
+    def __init__(self, max_connections=100, max_per_host=16, chunk_size=64 * 1024, timeout=60,
+                 user_agent=DEFAULT_USER_AGENT, max_retries=3, scheduler=None):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.max_retries = max_retries
+        self.scheduler = scheduler or DomainScheduler()
+        self.session = None
+
+    @classmethod
+    def from_config(cls, config, scheduler=None):
+        # Build a downloader from the "downloads" section of config.json
+        options = config.get("downloads", {})
+        return cls(
+            max_connections=options.get("max_connections", 100),
+            max_per_host=options.get("max_per_host", 16),
+            chunk_size=options.get("chunk_size", 64 * 1024),
+            timeout=options.get("timeout", 60),
+            user_agent=options.get("user_agent", DEFAULT_USER_AGENT),
+            max_retries=options.get("max_retries", 3),
+            scheduler=scheduler or DomainScheduler.from_config(config),
+        )
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_per_host,
+                ttl_dns_cache=300,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': self.user_agent},
+                # No total timeout: queued downloads wait on the connector limits
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=self.timeout),
+            )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @asynccontextmanager
+    async def request(self, url, headers=None):
+        # GET through the domain scheduler. 429/503 and timeouts are fed back to it and
+        # retried after any Retry-After pause; the domain slot is held while the body streams.
+        for attempt in range(self.max_retries + 1):
+            ticket = await self.scheduler.acquire(url)
+            try:
+                response = await self.session.get(url, headers=headers)
+            except asyncio.TimeoutError:
+                self.scheduler.release(ticket, timed_out=True)
+                if attempt < self.max_retries:
+                    continue
+                raise
+            except BaseException:
+                self.scheduler.release(ticket)
+                raise
+
+            ticket.headers_received()
+            retry = response.status in BACKOFF_STATUSES and attempt < self.max_retries
+            timed_out = False
+            try:
+                if not retry:
+                    yield response
+                    return
+            except asyncio.TimeoutError:
+                timed_out = True
+                raise
+            finally:
+                response.release()
+                self.scheduler.release(ticket, response.status, response.headers.get('Retry-After'), timed_out)
+
+    async def download(self, link, file_path, headers=None):
+        # Write to a temporary file first so a failed transfer never leaves a truncated PDF.
+        # The body is hashed while it streams so callers can address it by content.
+        partial_path = file_path + '.part'
+        digest = hashlib.sha256()
+        bytes_written = 0
+        try:
+            async with self.request(link, headers=headers) as response:
+                result = {
+                    'status': response.status,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }
+                if response.status == 304:
+                    return result
+                response.raise_for_status()
+                with open(partial_path, 'wb') as pdf_file:
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        pdf_file.write(chunk)
+                        digest.update(chunk)
+                        bytes_written += len(chunk)
+            os.replace(partial_path, file_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        result['file_size'] = bytes_written
+        result['sha256'] = digest.hexdigest()
+        return result
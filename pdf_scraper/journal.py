@@ -0,0 +1,73 @@
+import json
+import time
+import sqlite3
+
+
+# Append-only SQLite journal of a crawl. Each site is recorded as done (with its PDF
+# records) or failed the moment it finishes, so a restarted run can skip completed
+# work and retry only the failures.
+class RunJournal:
+    def __init__(self, path='crawl_journal.sqlite'):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS sites (
+                url TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                site TEXT NOT NULL,
+                record TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS records_site ON records (site);
+        ''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def reset(self):
+        # Start a fresh run
+        with self.connection:
+            self.connection.execute('DELETE FROM records')
+            self.connection.execute('DELETE FROM sites')
+
+    def completed_sites(self):
+        return {row[0] for row in self.connection.execute("SELECT url FROM sites WHERE status = 'done'")}
+
+    def failed_sites(self):
+        return dict(self.connection.execute("SELECT url, error FROM sites WHERE status = 'failed'"))
+
+    def _finish(self, url, status, error, pdf_metadata_list):
+        with self.connection:
+            # A retried site replaces whatever an earlier attempt left behind
+            self.connection.execute('DELETE FROM records WHERE site = ?', (url,))
+            self.connection.executemany(
+                'INSERT INTO records (site, record) VALUES (?, ?)',
+                [(url, json.dumps(metadata, default=str)) for metadata in pdf_metadata_list],
+            )
+            self.connection.execute('''
+                INSERT INTO sites (url, status, error, finished_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    status = excluded.status,
+                    error = excluded.error,
+                    attempts = sites.attempts + 1,
+                    finished_at = excluded.finished_at
+            ''', (url, status, error, time.time()))
+
+    def site_done(self, url, pdf_metadata_list):
+        self._finish(url, 'done', None, pdf_metadata_list)
+
+    def site_failed(self, url, error, pdf_metadata_list=()):
+        self._finish(url, 'failed', str(error), pdf_metadata_list)
+
+    def records(self, completed_only=False):
+        query = 'SELECT record FROM records'
+        if completed_only:
+            query += " WHERE site IN (SELECT url FROM sites WHERE status = 'done')"
+        for (record,) in self.connection.execute(query + ' ORDER BY id'):
+            yield json.loads(record)
@@ -0,0 +1,123 @@
+import asyncio
+from urllib.parse import urlparse
+
+DEFAULT_BLOCKED_TYPES = ('image', 'media', 'font', 'stylesheet', 'texttrack', 'eventsource', 'websocket', 'manifest')
+
+DEFAULT_BLOCKED_DOMAINS = (
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'facebook.net', 'connect.facebook.com', 'hotjar.com', 'segment.io', 'segment.com',
+    'mixpanel.com', 'newrelic.com', 'nr-data.net', 'optimizely.com', 'quantserve.com',
+    'scorecardresearch.com', 'adobedtm.com', 'demdex.net', 'omtrdc.net', 'snap.licdn.com',
+    'ads-twitter.com', 'bat.bing.com', 'clarity.ms', 'cookielaw.org', 'onetrust.com',
+)
+
+# Typical transfer sizes used to estimate what a blocked request would have cost
+ESTIMATED_BYTES = {
+    'image': 60 * 1024,
+    'media': 1024 * 1024,
+    'font': 40 * 1024,
+    'stylesheet': 30 * 1024,
+    'script': 50 * 1024,
+}
+DEFAULT_ESTIMATED_BYTES = 10 * 1024
+
+# Second-level labels that are part of the public suffix, e.g. "co.uk", "com.au"
+_SHARED_SECOND_LEVEL = ('co', 'com', 'net', 'org', 'gov', 'ac', 'edu')
+
+
+def site_domain(host):
+    labels = host.lower().split('.')
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in _SHARED_SECOND_LEVEL:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+
+def _matches(host, domains):
+    return any(host == domain or host.endswith('.' + domain) for domain in domains)
+
+
+class ResourceStats:
+    def __init__(self, url):
+        self.url = url
+        self.allowed = 0
+        self.blocked = 0
+        self.blocked_by_type = {}
+        self.estimated_bytes_saved = 0
+        self.bytes_loaded = 0
+
+    def as_dict(self):
+        return {
+            'url': self.url,
+            'allowed': self.allowed,
+            'blocked': self.blocked,
+            'blocked_by_type': dict(self.blocked_by_type),
+            'estimated_bytes_saved': self.estimated_bytes_saved,
+            'bytes_loaded': self.bytes_loaded,
+        }
+
+
+# Request interception for browser page loads. Heavy resource types and tracker
+# (or, optionally, any third-party) domains are aborted; sites on the allow-list
+# load everything for the cases where blocking breaks the page.
+class ResourceFilter:
+    def __init__(self, blocked_types=DEFAULT_BLOCKED_TYPES, blocked_domains=DEFAULT_BLOCKED_DOMAINS,
+                 block_third_party=False, allow_sites=()):
+        self.blocked_types = set(blocked_types)
+        self.blocked_domains = tuple(blocked_domains)
+        self.block_third_party = block_third_party
+        self.allow_sites = tuple(allow_sites)
+
+    @classmethod
+    def from_config(cls, config):
+        # Build a filter from the "resource_filter" section of config.json, or None if disabled
+        options = config.get("resource_filter", {})
+        if not options.get("enabled", True):
+            return None
+        return cls(
+            blocked_types=options.get("blocked_types", DEFAULT_BLOCKED_TYPES),
+            blocked_domains=options.get("blocked_domains", DEFAULT_BLOCKED_DOMAINS),
+            block_third_party=options.get("block_third_party", False),
+            allow_sites=options.get("allow_sites", ()),
+        )
+
+    def should_block(self, request_url, resource_type, site):
+        if resource_type == 'document':
+            return False
+        if resource_type in self.blocked_types:
+            return True
+        host = (urlparse(request_url).hostname or '').lower()
+        if not host:
+            return False
+        if _matches(host, self.blocked_domains):
+            return True
+        return self.block_third_party and site_domain(host) != site
+
+    async def attach(self, page, url):
+        stats = ResourceStats(url)
+        host = (urlparse(url).hostname or '').lower()
+        site = site_domain(host)
+
+        async def handle(request):
+            try:
+                if self.should_block(request.url, request.resourceType, site):
+                    stats.blocked += 1
+                    stats.blocked_by_type[request.resourceType] = stats.blocked_by_type.get(request.resourceType, 0) + 1
+                    stats.estimated_bytes_saved += ESTIMATED_BYTES.get(request.resourceType, DEFAULT_ESTIMATED_BYTES)
+                    await request.abort()
+                else:
+                    stats.allowed += 1
+                    await request.continue_()
+            except Exception:
+                # The request may already be handled if the page navigated away
+                pass
+
+        def count_response(response):
+            length = response.headers.get('content-length')
+            if length and length.isdigit():
+                stats.bytes_loaded += int(length)
+
+        page.on('response', count_response)
+        if not _matches(host, self.allow_sites):
+            await page.setRequestInterception(True)
+            page.on('request', lambda request: asyncio.ensure_future(handle(request)))
+        return stats
@@ -0,0 +1,155 @@
+import time
+import asyncio
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Responses that mean "slow down" rather than "this request is broken"
+BACKOFF_STATUSES = (429, 503)
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _DomainState:
+    def __init__(self, concurrency, rate, burst):
+        self.limit = float(concurrency)
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_backoff = 0.0
+        self.backoffs = 0
+        self.requests = 0
+        self.changed = asyncio.Event()
+
+    def try_acquire(self, now):
+        # Returns 0 when a request may start now, otherwise how long to wait (None = until a release)
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.in_flight += 1
+        self.requests += 1
+        return 0
+
+
+class Ticket:
+    def __init__(self, domain):
+        self.domain = domain
+        self.started = time.monotonic()
+        self.latency = None
+
+    def request_started(self):
+        # For a ticket taken before the request could be sent: waiting for a browser page is not latency
+        self.started = time.monotonic()
+
+    def headers_received(self):
+        # Latency is judged on time to first byte, not on how long a large body takes
+        self.latency = time.monotonic() - self.started
+
+
+# Per-domain concurrency budget and token-bucket rate that adapt AIMD-style:
+# fast successes add to both additively, 429/503/timeouts cut them multiplicatively,
+# and a Retry-After header pauses the whole domain for the requested time.
+class DomainScheduler:
+    def __init__(self, initial_concurrency=2, min_concurrency=1, max_concurrency=16,
+                 initial_rate=2.0, min_rate=0.2, max_rate=20.0, burst=4,
+                 decrease_factor=0.5, slow_threshold=5.0, backoff_interval=1.0):
+        self.initial_concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.decrease_factor = decrease_factor
+        self.slow_threshold = slow_threshold
+        self.backoff_interval = backoff_interval
+        self.domains = {}
+
+    @classmethod
+    def from_config(cls, config):
+        # Build a scheduler from the "scheduler" section of config.json
+        options = config.get("scheduler", {})
+        return cls(
+            initial_concurrency=options.get("initial_concurrency", 2),
+            min_concurrency=options.get("min_concurrency", 1),
+            max_concurrency=options.get("max_concurrency", 16),
+            initial_rate=options.get("initial_rate", 2.0),
+            min_rate=options.get("min_rate", 0.2),
+            max_rate=options.get("max_rate", 20.0),
+            burst=options.get("burst", 4),
+            decrease_factor=options.get("decrease_factor", 0.5),
+            slow_threshold=options.get("slow_threshold", 5.0),
+            backoff_interval=options.get("backoff_interval", 1.0),
+        )
+
+    def _state(self, domain):
+        state = self.domains.get(domain)
+        if state is None:
+            state = _DomainState(self.initial_concurrency, self.initial_rate, self.burst)
+            self.domains[domain] = state
+        return state
+
+    async def acquire(self, url):
+        domain = urlparse(url).netloc.lower()
+        state = self._state(domain)
+        while True:
+            delay = state.try_acquire(time.monotonic())
+            if delay == 0:
+                return Ticket(domain)
+            state.changed.clear()
+            try:
+                await asyncio.wait_for(state.changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, ticket, status=None, retry_after=None, timed_out=False):
+        state = self.domains[ticket.domain]
+        state.in_flight -= 1
+        now = time.monotonic()
+        elapsed = ticket.latency if ticket.latency is not None else now - ticket.started
+
+        if timed_out or status in BACKOFF_STATUSES:
+            delay = parse_retry_after(retry_after) if isinstance(retry_after, str) else retry_after
+            if delay:
+                state.blocked_until = max(state.blocked_until, now + delay)
+            # One cut per interval, so a burst of 429s from the same window is not compounded
+            if now - state.last_backoff >= self.backoff_interval:
+                state.last_backoff = now
+                state.backoffs += 1
+                state.limit = max(self.min_concurrency, state.limit * self.decrease_factor)
+                state.rate = max(self.min_rate, state.rate * self.decrease_factor)
+        elif status is not None and status < 400 and elapsed <= self.slow_threshold:
+            state.limit = min(self.max_concurrency, state.limit + 1 / state.limit)
+            state.rate = min(self.max_rate, state.rate + 1 / state.limit)
+
+        state.changed.set()
+
+    def snapshot(self):
+        return {
+            domain: {
+                'concurrency': round(state.limit, 2),
+                'rate': round(state.rate, 2),
+                'requests': state.requests,
+                'backoffs': state.backoffs,
+            }
+            for domain, state in self.domains.items()
+        }
@@ -1,40 +1,136 @@
-from pdf_scraper.utils import get_title, get_pdf_metadata
-from pyppeteer import launch
+import asyncio
+from pyppeteer.errors import TimeoutError as PageTimeoutError
+from pdf_scraper.utils import extract_pdf_links, get_pdf_metadata, DEFAULT_LINK_RULES
+from pdf_scraper.browser_pool import BrowserPool
+from pdf_scraper.downloader import PdfDownloader
+from pdf_scraper.store import PdfStore
+from pdf_scraper.static_fetch import fetch_static_links
+from pdf_scraper.tracing import get_tracer
 
-async def scrape_website(url, download_folder):    
+async def browser_pdf_links(url, pool, link_rules, resource_filter=None, scheduler=None):
+    tracer = get_tracer()
+    # Page loads count against the same per-domain budget as plain HTTP requests. The ticket
+    # comes before the page, so a domain paused by Retry-After or at its concurrency limit
+    # waits without holding a browser page that other sites could use.
+    ticket = await scheduler.acquire(url) if scheduler is not None else None
+    try:
+        async with pool.page() as page:
+            # Block images, fonts, media and trackers; only the anchors are needed
+            stats = await resource_filter.attach(page, url) if resource_filter is not None else None
+
+            if ticket is not None:
+                ticket.request_started()
+            try:
+                with tracer.span('goto', url):
+                    response = await page.goto(url, {'waitUntil': 'domcontentloaded'})
+            except (asyncio.TimeoutError, PageTimeoutError):
+                # pyppeteer's navigation timeout is its own class, not an asyncio.TimeoutError
+                if ticket is not None:
+                    scheduler.release(ticket, timed_out=True)
+                    ticket = None
+                raise
+            if ticket is not None:
+                ticket.headers_received()
+                loaded, ticket = ticket, None
+                if response is None:
+                    scheduler.release(loaded)
+                else:
+                    scheduler.release(loaded, response.status, response.headers.get('retry-after'))
+            if stats is not None:
+                print(f"Blocked {stats.blocked} of {stats.blocked + stats.allowed} requests on {url}, "
+                      f"~{stats.estimated_bytes_saved // 1024} KB saved, {stats.bytes_loaded // 1024} KB loaded")
+                tracer.count('page_bytes_loaded', stats.bytes_loaded, url)
+                tracer.count('requests_blocked', stats.blocked, url)
+
+            # You can perform scraping operations using page.evaluate or other pyppeteer functions
+            with tracer.span('title', url):
+                title = await page.title()
+            print(f"Title of {url}: {title}")
+
+            # Extract every PDF link with its text and context in a single pass
+            with tracer.span('extract_links', url, tier='browser'):
+                return await extract_pdf_links(page, link_rules)
+    finally:
+        # Still held only if no page was available, the filter failed or the load failed otherwise
+        if ticket is not None:
+            scheduler.release(ticket)
+
+async def find_pdf_links(url, pool, downloader, link_rules, tiers, fetch_mode, resource_filter=None):
+    # fetch_mode "browser" always renders, "static" never does, "auto" tries the
+    # plain HTTP fetch first and escalates when the page looks empty or JS-driven
+    tier = tiers.get(url) if tiers is not None else None
+    if fetch_mode == 'browser' or (fetch_mode == 'auto' and tier == 'browser'):
+        return await browser_pdf_links(url, pool, link_rules, resource_filter, downloader.scheduler)
+
+    try:
+        with get_tracer().span('static_fetch', url):
+            static_result = await fetch_static_links(downloader, url, link_rules)
+    except Exception as e:
+        print(f"Static fetch failed for {url}: {e}")
+        static_result = None
+
+    if static_result is not None:
+        pdf_links, js_driven = static_result
+        if fetch_mode == 'static' or (pdf_links and not js_driven) or (tier == 'static' and not js_driven):
+            if tiers is not None:
+                tiers.remember(url, 'static')
+            return pdf_links
+    elif fetch_mode == 'static':
+        return []
+
+    pdf_links = await browser_pdf_links(url, pool, link_rules, resource_filter, downloader.scheduler)
+    if tiers is not None:
+        # Only pin the domain to the browser when rendering actually found something
+        tiers.remember(url, 'browser' if pdf_links else 'static')
+    return pdf_links
+
+async def scrape_website(url, download_folder, pool=None, downloader=None, store=None, link_rules=None,
+                         tiers=None, fetch_mode='auto', resource_filter=None, journal=None):    
+    # Without shared resources, fall back to short-lived ones for this site.
+    # The pool only launches Chromium if a page is actually requested.
+    if pool is None:
+        async with BrowserPool(browsers=1, pages_per_browser=1) as own_pool:
+            return await scrape_website(url, download_folder, own_pool, downloader, store,
+                                        link_rules, tiers, fetch_mode, resource_filter, journal)
+    if downloader is None:
+        async with PdfDownloader() as own_downloader:
+            return await scrape_website(url, download_folder, pool, own_downloader, store,
+                                        link_rules, tiers, fetch_mode, resource_filter, journal)
+    if store is None:
+        own_store = PdfStore(download_folder)
+        try:
+            return await scrape_website(url, download_folder, pool, downloader, own_store,
+                                        link_rules, tiers, fetch_mode, resource_filter, journal)
+        finally:
+            own_store.close()
+
+    tracer = get_tracer()
     try:        
-        browser = await launch(
-            handleSIGINT=False,
-            handleSIGTERM=False,
-            handleSIGHUP=False
-        )
-        page = await browser.newPage()
-        await page.goto(url, {'waitUntil': 'domcontentloaded'})
-        
-        # You can perform scraping operations using page.evaluate or other pyppeteer functions
-        title = await page.title()
-        print(f"Title of {url}: {title}")
-
-        # Extract PDF links using pyppeteer
-        pdf_links = await page.evaluate('''() => {
-            const pdfLinks = [];
-            for (const link of document.querySelectorAll('a[href$=".pdf"]')) {
-                pdfLinks.push(link.href);
-            }
-            return pdfLinks;
-        }''')
-        
-        # Fetch PDF metadata asynchronously
-        pdf_metadata_list = []
-        for link in pdf_links:
-            title = await get_title(page, link)
-            metadata = await get_pdf_metadata(link, download_folder)
-            metadata['title'] = title
-            pdf_metadata_list.append(metadata)
-
-        await browser.close()
+        with tracer.span('site', url):
+            with tracer.span('find_links', url):
+                pdf_links = await find_pdf_links(url, pool, downloader, link_rules or DEFAULT_LINK_RULES, tiers,
+                                                 fetch_mode, resource_filter)
+            tracer.count('pdf_links', len(pdf_links), url)
+
+            # The page goes back to the pool before the downloads start
+            pdf_metadata_list = await asyncio.gather(
+                *(get_pdf_metadata(link['href'], download_folder, downloader, store) for link in pdf_links)
+            )
+        for metadata, link in zip(pdf_metadata_list, pdf_links):
+            metadata['title'] = link['text']
+            metadata['context'] = link['context']
+
+        if journal is not None:
+            # Sites with failed downloads are journalled as failed so a resumed run retries them
+            failed_downloads = sum(1 for metadata in pdf_metadata_list if metadata['file_path'] is None)
+            if failed_downloads:
+                journal.site_failed(url, f"{failed_downloads} PDF downloads failed", pdf_metadata_list)
+            else:
+                journal.site_done(url, pdf_metadata_list)
 
         return pdf_metadata_list     
     except Exception as e:
         print(f"Error while scraping {url}: {e}")
-        return []
\ No newline at end of file
+        if journal is not None:
+            journal.site_failed(url, e)
+        return []
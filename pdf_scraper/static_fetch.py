@@ -0,0 +1,102 @@
+import os
+import re
+import json
+import asyncio
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+
+# Pages bigger than this are left to the browser rather than parsed in memory
+MAX_HTML_BYTES = 5 * 1024 * 1024
+
+# Mount points left empty by client-side frameworks until their JavaScript runs
+SPA_MARKERS = ('id="root"', 'id="app"', 'id="__next"', 'ng-app', 'ng-version', 'data-reactroot')
+
+
+def _parse_links(html, base_url, link_rules):
+    soup = BeautifulSoup(html, "lxml")
+    base = soup.find('base', href=True)
+    if base:
+        base_url = urljoin(base_url, base['href'])
+
+    candidates = soup.select(', '.join(link_rules.get("selectors", [])) or 'a[href$=".pdf" i]')
+    regexes = [re.compile(pattern, re.IGNORECASE) for pattern in link_rules.get("patterns", [])]
+    if regexes:
+        seen_elements = set(map(id, candidates))
+        for link_el in soup.select('a[href]'):
+            if id(link_el) not in seen_elements and any(regex.search(urljoin(base_url, link_el['href'])) for regex in regexes):
+                candidates.append(link_el)
+
+    # Same shape as extract_pdf_links returns from the browser
+    seen = set()
+    pdf_links = []
+    for link_el in candidates:
+        href = link_el.get('href')
+        if not href:
+            continue
+        href = urljoin(base_url, href)
+        if href in seen:
+            continue
+        seen.add(href)
+        block = link_el.find_parent(['li', 'p', 'td', 'tr', 'dd', 'article', 'section', 'div']) or link_el.parent
+        context = ' '.join(block.get_text(' ', strip=True).split())[:300] if block else ''
+        pdf_links.append({'href': href, 'text': link_el.get_text(' ', strip=True) or link_el.get('title', ''), 'context': context})
+
+    return pdf_links, looks_js_driven(soup, html)
+
+
+def looks_js_driven(soup, html):
+    # Little visible text plus framework markers or several scripts means the DOM is built client-side
+    body = soup.body
+    for tag in (body or soup).find_all(['script', 'style', 'noscript', 'template']):
+        tag.extract()
+    visible_text = len((body or soup).get_text(' ', strip=True))
+    scripts = html.count('<script')
+    return visible_text < 500 and (scripts >= 3 or any(marker in html for marker in SPA_MARKERS))
+
+
+async def fetch_static_links(downloader, url, link_rules):
+    # Plain HTTP fetch through the downloader's scheduler; returns None when the response is not usable HTML
+    async with downloader.request(url) as response:
+        if response.status >= 400 or 'html' not in response.headers.get('Content-Type', 'text/html'):
+            return None
+        if response.content_length and response.content_length > MAX_HTML_BYTES:
+            return None
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            size += len(chunk)
+            if size > MAX_HTML_BYTES:
+                return None
+            chunks.append(chunk)
+        html = b''.join(chunks).decode(response.charset or 'utf-8', errors='replace')
+        final_url = str(response.url)
+
+    # Parsing is CPU work; keep it off the event loop
+    return await asyncio.to_thread(_parse_links, html, final_url, link_rules)
+
+
+# Remembers per domain whether the static fetch was enough ("static") or the site
+# needed the browser ("browser"), persisted as JSON between runs
+class FetchTiers:
+    def __init__(self, path):
+        self.path = path
+        self.tiers = {}
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.tiers = json.load(file)
+
+    @staticmethod
+    def domain(url):
+        return urlparse(url).netloc.lower()
+
+    def get(self, url):
+        return self.tiers.get(self.domain(url))
+
+    def remember(self, url, tier):
+        self.tiers[self.domain(url)] = tier
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(self.tiers, file, indent=4, sort_keys=True)
+        os.replace(temp_path, self.path)
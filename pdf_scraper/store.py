@@ -0,0 +1,99 @@
+import os
+import time
+import uuid
+import sqlite3
+from pdf_scraper.tracing import get_tracer
+
+
+# Persistent, content-addressed PDF store shared across runs. The manifest maps every
+# URL to the validators and SHA-256 of its last download, so re-crawls send conditional
+# GETs and skip unchanged documents. Files live under objects/<sha[:2]>/<sha>.pdf, which
+# stores identical PDFs linked from different URLs only once.
+class PdfStore:
+    def __init__(self, root):
+        self.root = root
+        self.objects_folder = os.path.join(root, 'objects')
+        self.tmp_folder = os.path.join(root, 'tmp')
+        os.makedirs(self.objects_folder, exist_ok=True)
+        os.makedirs(self.tmp_folder, exist_ok=True)
+
+        self.connection = sqlite3.connect(os.path.join(root, 'manifest.sqlite'))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS manifest (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                sha256 TEXT NOT NULL,
+                file_size INTEGER,
+                fetched_at REAL
+            )
+        ''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_folder, sha256[:2], f"{sha256}.pdf")
+
+    def lookup(self, url):
+        row = self.connection.execute('SELECT * FROM manifest WHERE url = ?', (url,)).fetchone()
+        if row is None or not os.path.exists(self.object_path(row['sha256'])):
+            return None
+        return dict(row)
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is None:
+            return headers
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def record(self, url, etag, last_modified, sha256, file_size):
+        self.connection.execute('''
+            INSERT INTO manifest (url, etag, last_modified, sha256, file_size, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                sha256 = excluded.sha256,
+                file_size = excluded.file_size,
+                fetched_at = excluded.fetched_at
+        ''', (url, etag, last_modified, sha256, file_size, time.time()))
+        self.connection.commit()
+
+    def add_file(self, temp_path, sha256):
+        # Move a finished download into place, or drop it if the content is already stored
+        final_path = self.object_path(sha256)
+        if os.path.exists(final_path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temp_path, final_path)
+        return final_path
+
+    async def fetch(self, downloader, url):
+        entry = self.lookup(url)
+        temp_path = os.path.join(self.tmp_folder, f"{uuid.uuid4().hex}.pdf")
+        result = await downloader.download(url, temp_path, headers=self.conditional_headers(entry))
+
+        tracer = get_tracer()
+        if result['status'] == 304:
+            tracer.count('pdfs_not_modified', url=url)
+            # Unchanged since the last run: keep the stored copy, refresh the validators
+            self.record(url, result['etag'] or entry['etag'], result['last_modified'] or entry['last_modified'],
+                        entry['sha256'], entry['file_size'])
+            return {'file_path': self.object_path(entry['sha256']), 'file_size': entry['file_size'],
+                    'sha256': entry['sha256'], 'changed': False}
+
+        tracer.count('pdfs_downloaded', url=url)
+        tracer.count('bytes_downloaded', result['file_size'] or 0, url)
+        file_path = self.add_file(temp_path, result['sha256'])
+        self.record(url, result['etag'], result['last_modified'], result['sha256'], result['file_size'])
+        changed = entry is None or entry['sha256'] != result['sha256']
+        return {'file_path': file_path, 'file_size': result['file_size'],
+                'sha256': result['sha256'], 'changed': changed}
@@ -0,0 +1,198 @@
+import json
+import time
+import heapq
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+def domain_of(url):
+    return (urlsplit(url).hostname or '').lower() if url else None
+
+
+class _StageStats:
+    __slots__ = ('count', 'errors', 'total', 'max')
+
+    def __init__(self):
+        self.count = self.errors = 0
+        self.total = self.max = 0.0
+
+    def add(self, duration, error):
+        self.count += 1
+        self.errors += bool(error)
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def as_dict(self):
+        return {'count': self.count, 'errors': self.errors, 'total': round(self.total, 6),
+                'mean': round(self.total / self.count, 6) if self.count else None, 'max': round(self.max, 6)}
+
+
+# Does nothing; used while tracing is off so the instrumented code pays almost nothing
+class NullTracer:
+    enabled = False
+
+    @contextmanager
+    def span(self, stage, url=None, **attributes):
+        yield
+
+    def count(self, name, value=1, url=None):
+        pass
+
+    def error(self, stage, url, exception):
+        pass
+
+
+# Timing spans per stage, site and link, counters and errors for one crawl. Spans are
+# aggregated per stage and per domain, the slowest individual spans are kept, and every
+# span can also be appended to a JSONL event file as it ends. report() is the
+# machine-readable summary: slowest stages and domains first.
+class Tracer:
+    enabled = True
+
+    def __init__(self, events_file=None, keep_slowest=50, max_errors=200):
+        self.events = open(events_file, 'w', encoding='utf-8') if events_file else None
+        self.keep_slowest = keep_slowest
+        self.max_errors = max_errors
+        self.started_at = time.time()
+        self.stages = {}
+        self.domains = {}
+        self.counters = {}
+        self.domain_counters = {}
+        self.errors = []
+        self.slowest = []  # min-heap of (duration, sequence, span)
+        self.sequence = 0
+
+    @contextmanager
+    def span(self, stage, url=None, **attributes):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._finish(stage, url, time.perf_counter() - start, error, attributes)
+
+    def _finish(self, stage, url, duration, error, attributes):
+        domain = domain_of(url)
+        self.stages.setdefault(stage, _StageStats()).add(duration, error)
+        if domain:
+            self.domains.setdefault(domain, {}).setdefault(stage, _StageStats()).add(duration, error)
+        span = {'stage': stage, 'url': url, 'domain': domain, 'duration': round(duration, 6), **attributes}
+        if error is not None:
+            span['error'] = f"{type(error).__name__}: {error}"
+            self.error(stage, url, error)
+        self.sequence += 1
+        entry = (duration, self.sequence, span)
+        if len(self.slowest) < self.keep_slowest:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+        if self.events is not None:
+            self.events.write(json.dumps({'time': time.time(), **span}, default=str) + '\n')
+
+    def count(self, name, value=1, url=None):
+        self.counters[name] = self.counters.get(name, 0) + value
+        domain = domain_of(url)
+        if domain:
+            counters = self.domain_counters.setdefault(domain, {})
+            counters[name] = counters.get(name, 0) + value
+
+    def error(self, stage, url, exception):
+        self.count(f"{stage}_failures", url=url)
+        if len(self.errors) < self.max_errors:
+            self.errors.append({
+                'stage': stage,
+                'url': url,
+                'error': f"{type(exception).__name__}: {exception}",
+            })
+
+    def report(self, top=20):
+        domains = []
+        for domain, stages in self.domains.items():
+            # Spans nest (a site contains its page load and downloads), so whole-site time ranks domains
+            domains.append({
+                'domain': domain,
+                'site_time': round(stages['site'].total, 6) if 'site' in stages else None,
+                'span_time': round(sum(stats.total for stats in stages.values()), 6),
+                'stages': {stage: stats.as_dict() for stage, stats in stages.items()},
+                'counters': self.domain_counters.get(domain, {}),
+            })
+        domains.sort(key=lambda item: item['site_time'] if item['site_time'] is not None else item['span_time'],
+                     reverse=True)
+        stages = sorted(({'stage': stage, **stats.as_dict()} for stage, stats in self.stages.items()),
+                        key=lambda item: item['total'], reverse=True)
+        return {
+            'started_at': self.started_at,
+            'duration': round(time.time() - self.started_at, 6),
+            'stages': stages,
+            'slowest_domains': domains[:top],
+            'slowest_spans': [span for _, _, span in sorted(self.slowest, reverse=True)][:top],
+            'counters': self.counters,
+            'errors': self.errors,
+        }
+
+    def close(self):
+        if self.events is not None:
+            self.events.close()
+            self.events = None
+
+
+_tracer = NullTracer()
+
+
+def get_tracer():
+    return _tracer
+
+
+def set_tracer(tracer):
+    # Process-wide, like the browser pool and downloader it observes: one crawl per process
+    global _tracer
+    _tracer = tracer or NullTracer()
+
+
+@contextmanager
+def profiled(cpu_profile_file=None, trace_memory=False, top=20):
+    # Optional cProfile and tracemalloc capture around a block; the summaries are put
+    # into the yielded dict once the block ends
+    results = {}
+    profiler = None
+    if cpu_profile_file:
+        import cProfile
+
+        profiler = cProfile.Profile()
+    if trace_memory:
+        import tracemalloc
+
+        tracemalloc.start(25)
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield results
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cpu_profile_file)
+            results['cpu_profile'] = {'file': cpu_profile_file, 'top_functions': _top_functions(profiler, top)}
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results['memory'] = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top_allocations': [{'where': str(stat.traceback[0]), 'bytes': stat.size, 'count': stat.count}
+                                    for stat in snapshot.statistics('lineno')[:top]],
+            }
+
+
+def _top_functions(profiler, top):
+    import pstats
+
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (file_name, line, function), (_, calls, _, cumulative, _) in stats.stats.items():
+        rows.append({'function': f"{file_name}:{line}({function})", 'calls': calls, 'cumulative': round(cumulative, 6)})
+    rows.sort(key=lambda row: row['cumulative'], reverse=True)
+    return rows[:top]
@@ -1,37 +1,83 @@
-import requests
 import os
 import json
-async def get_pdf_metadata(link, download_folder):
-    try:
-        # Fetch PDF file size using the requests library
-        response = requests.head(link)
-        file_size = int(response.headers.get('Content-Length', 0))
+from pdf_scraper.downloader import PdfDownloader
+from pdf_scraper.store import PdfStore
+from pdf_scraper.tracing import get_tracer
+
+async def get_pdf_metadata(link, download_folder, downloader=None, store=None):
+    # Without a shared downloader or store, open short-lived ones for this one file
+    if downloader is None:
+        async with PdfDownloader() as own_downloader:
+            return await get_pdf_metadata(link, download_folder, own_downloader, store)
+    if store is None:
+        own_store = PdfStore(download_folder)
+        try:
+            return await get_pdf_metadata(link, download_folder, downloader, own_store)
+        finally:
+            own_store.close()
 
-        # Download the PDF file
-        pdf_file_path = os.path.join(download_folder, f"{hash(link)}.pdf")
-        with open(pdf_file_path, 'wb') as pdf_file:
-            response = requests.get(link)
-            pdf_file.write(response.content)
+    try:
+        # Conditional GET against the manifest; unchanged PDFs are not transferred again
+        with get_tracer().span('download', link):
+            stored = await store.fetch(downloader, link)
 
-        return {'url': link, 'title': '', 'file_size': file_size, 'file_path': pdf_file_path}
+        return {'url': link, 'title': '', **stored}
 
     except Exception as e:
         print(f"Error while fetching metadata for {link}: {e}")
-        return {'url': link, 'title': '', 'file_size': None, 'file_path': None}
+        return {'url': link, 'title': '', 'file_size': None, 'file_path': None, 'sha256': None, 'changed': None}
     
-async def get_title(page, link):
+# Anchors treated as PDF links: the href ends in .pdf (any case), carries .pdf before a
+# query string, or declares the PDF content type. Extra regex patterns on the href catch
+# download endpoints such as "download.aspx?id=1&format=pdf".
+DEFAULT_LINK_RULES = {
+    "selectors": [
+        'a[href$=".pdf" i]',
+        'a[href*=".pdf?" i]',
+        'a[href*=".pdf#" i]',
+        'a[type="application/pdf" i]',
+    ],
+    "patterns": [
+        "[?&](format|type|filetype)=pdf\\b",
+    ],
+}
+
+async def extract_pdf_links(page, link_rules=None):
+    link_rules = link_rules or DEFAULT_LINK_RULES
     try:
-        # Extract the title of the PDF link using pyppeteer
-        title = await page.evaluate('''(link) => {
-            const pdfLink = document.querySelector(`a[href="${link}"]`);
-            return pdfLink ? pdfLink.innerText.trim() : '';
-        }''', link)
+        # One evaluate per page returns href, anchor text and surrounding context for every match
+        return await page.evaluate('''(selectors, patterns) => {
+            const regexes = patterns.map((pattern) => new RegExp(pattern, 'i'));
+            const candidates = new Set(document.querySelectorAll(selectors.join(',') || 'a[href$=".pdf" i]'));
+            if (regexes.length) {
+                for (const link of document.querySelectorAll('a[href]')) {
+                    if (regexes.some((regex) => regex.test(link.href))) {
+                        candidates.add(link);
+                    }
+                }
+            }
 
-        return title
+            const seen = new Set();
+            const pdfLinks = [];
+            for (const link of candidates) {
+                if (!link.href || seen.has(link.href)) {
+                    continue;
+                }
+                seen.add(link.href);
+                const block = link.closest('li, p, td, tr, dd, article, section, div') || link.parentElement;
+                pdfLinks.push({
+                    href: link.href,
+                    text: (link.innerText || link.title || '').trim(),
+                    context: block ? block.innerText.trim().replace(/\\s+/g, ' ').slice(0, 300) : '',
+                });
+            }
+            return pdfLinks;
+        }''', link_rules.get("selectors", []), link_rules.get("patterns", []))
 
     except Exception as e:
-        print(f"Error while fetching title for {link}: {e}")
-        return ''
+        # Re-raised so the site is journalled as failed and a resumed run retries it
+        print(f"Error while extracting PDF links: {e}")
+        raise
 
 def read_websites_from_file(file_path):
     with open(file_path, 'r') as file:        
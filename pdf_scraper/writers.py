@@ -0,0 +1,122 @@
+import os
+import csv
+import json
+
+# Columns written for every PDF record, in output order
+DEFAULT_FIELDS = ('url', 'title', 'file_size', 'file_path', 'sha256', 'changed', 'context')
+
+
+# Each writer appends records as sites complete and flushes them straight away, so
+# memory stays bounded and partial results are on disk while the crawl is running.
+class JsonlWriter:
+    extension = 'jsonl'
+
+    def __init__(self, path, fields=DEFAULT_FIELDS):
+        self.path = path
+        self.fields = fields
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write_many(self, pdf_metadata_list):
+        for metadata in pdf_metadata_list:
+            self.file.write(json.dumps({field: metadata.get(field) for field in self.fields}, default=str) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter:
+    extension = 'csv'
+
+    def __init__(self, path, fields=DEFAULT_FIELDS):
+        self.path = path
+        self.fields = fields
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=fields, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write_many(self, pdf_metadata_list):
+        self.writer.writerows(pdf_metadata_list)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# Parquet buffers up to row_group_size records and writes each batch as a row group.
+# The file only becomes readable once the writer is closed and the footer is written.
+class ParquetWriter:
+    extension = 'parquet'
+
+    def __init__(self, path, fields=DEFAULT_FIELDS, row_group_size=10000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.fields = fields
+        self.row_group_size = row_group_size
+        types = {'file_size': pa.int64(), 'changed': pa.bool_()}
+        self.schema = pa.schema([(field, types.get(field, pa.string())) for field in fields])
+        self.table_from_pylist = pa.Table.from_pylist
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.pending = []
+
+    def write_many(self, pdf_metadata_list):
+        for metadata in pdf_metadata_list:
+            self.pending.append({field: metadata.get(field) for field in self.fields})
+        if len(self.pending) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.writer.write_table(self.table_from_pylist(self.pending, schema=self.schema))
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+WRITERS = {
+    'jsonl': JsonlWriter,
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def create_writers(options):
+    # Build the writers named in the "outputs" section of config.json
+    base_path = options.get("path", "pdf_metadata")
+    fields = tuple(options.get("fields", DEFAULT_FIELDS))
+    writers = []
+    for output_format in options.get("formats", ["jsonl"]):
+        writer_class = WRITERS.get(output_format)
+        if writer_class is None:
+            raise ValueError(f"Unknown output format: {output_format}")
+        path = f"{base_path}.{writer_class.extension}"
+        if output_format == 'parquet':
+            writers.append(writer_class(path, fields, options.get("row_group_size", 10000)))
+        else:
+            writers.append(writer_class(path, fields))
+    return writers
+
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def export_excel(pdf_metadata_records, output_file, fields=DEFAULT_FIELDS):
+    # Write-only workbook: rows go straight to disk instead of building a DataFrame
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(fields))
+    for metadata in pdf_metadata_records:
+        sheet.append([metadata.get(field) for field in fields])
+    temp_path = output_file + '.tmp'
+    workbook.save(temp_path)
+    os.replace(temp_path, output_file)
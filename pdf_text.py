@@ -0,0 +1,135 @@
+import os
+import asyncio
+import hashlib
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+from dotenv import load_dotenv
+
+# Limits and parallelism, overridable from the environment (.env)
+load_dotenv()
+MAX_UPLOAD_BYTES = int(float(os.getenv("PDF_MAX_UPLOAD_MB", "100")) * 1024 * 1024)
+MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "2000"))
+MAX_TEXT_CHARS = int(os.getenv("PDF_MAX_TEXT_CHARS", "20000000"))
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+_executor = None
+
+
+class PdfLimitExceeded(Exception):
+    pass
+
+
+def get_executor():
+    # One process pool per service process, created on first use
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+# Worker-side functions: each opens the document from disk, so only a path crosses the process boundary
+def _page_count(path):
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def _extract_range(path, start, stop):
+    with fitz.open(path) as doc:
+        return [doc.load_page(page_num).get_text() for page_num in range(start, stop)]
+
+
+async def save_upload(pdf_file, max_bytes=MAX_UPLOAD_BYTES):
+    # Stream the upload to a temporary file in chunks instead of reading it into memory,
+    # hashing it on the way so the document can be looked up by content
+    size = 0
+    digest = hashlib.sha256()
+    temp = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+    try:
+        with temp:
+            while True:
+                chunk = await pdf_file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise PdfLimitExceeded(f"PDF is larger than {max_bytes // (1024 * 1024)} MB")
+                temp.write(chunk)
+                digest.update(chunk)
+    except BaseException:
+        os.remove(temp.name)
+        raise
+    return temp.name, digest.hexdigest()
+
+
+async def iter_pdf_pages(path, max_pages=MAX_PAGES, max_text_chars=MAX_TEXT_CHARS, pages_per_task=PAGES_PER_TASK):
+    # Yields (page_number, text) in order. Page ranges are extracted in parallel on the
+    # process pool, with at most one range per worker in flight, so the event loop stays free.
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+
+    page_count = await loop.run_in_executor(executor, _page_count, path)
+    if page_count > max_pages:
+        raise PdfLimitExceeded(f"PDF has {page_count} pages; the limit is {max_pages}")
+
+    ranges = iter([(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)])
+    pending = deque()
+
+    def submit_next():
+        page_range = next(ranges, None)
+        if page_range is not None:
+            pending.append((page_range[0], loop.run_in_executor(executor, _extract_range, path, *page_range)))
+
+    for _ in range(EXTRACT_WORKERS):
+        submit_next()
+
+    text_chars = 0
+    try:
+        while pending:
+            start, future = pending.popleft()
+            texts = await future
+            submit_next()
+            for offset, text in enumerate(texts):
+                text_chars += len(text)
+                if text_chars > max_text_chars:
+                    raise PdfLimitExceeded(f"PDF text exceeds {max_text_chars} characters")
+                yield start + offset, text
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+async def extract_pages(path, **limits):
+    return [text async for _, text in iter_pdf_pages(path, **limits)]
+
+
+async def extract_document(path, sha256, artifact_cache=None, **limits):
+    # A document already in the artifact cache is not parsed again; the read runs off the event loop
+    if artifact_cache is not None:
+        text = await asyncio.to_thread(artifact_cache.get_text, sha256)
+        if text is not None:
+            return text
+    pages = await extract_pages(path, **limits)
+    if artifact_cache is not None:
+        await asyncio.to_thread(artifact_cache.put_pages, sha256, pages)
+    return ''.join(pages)
+
+
+async def extract_upload_document(pdf_file, artifact_cache=None, **limits):
+    # Returns (sha256, text)
+    path, sha256 = await save_upload(pdf_file)
+    try:
+        return sha256, await extract_document(path, sha256, artifact_cache, **limits)
+    finally:
+        os.remove(path)
@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+from urllib.parse import urljoin
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from normal import get_links, COUNTRIES_LIST
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+def parse_links(url, body, selector):
+    # Runs in a worker process: BeautifulSoup/lxml parsing is CPU-bound and would hold the GIL
+    soup = BeautifulSoup(body, "lxml")
+    return [urljoin(url, link_el.get("href")) for link_el in soup.select(selector) if link_el.get("href")]
+
+
+# Fetch -> parse -> write pipeline. asyncio fetchers keep many downloads in flight,
+# raw bytes go through a bounded queue into a process pool for parsing, and parsed
+# results flow through a second bounded queue to a single JSONL writer. A full queue
+# stalls the stage before it, so memory is bounded by the queue sizes whatever the
+# number of URLs.
+async def run_pipeline(urls, output_path, selector='a[href]', fetch_concurrency=64,
+                       parse_workers=None, queue_size=None):
+    parse_workers = parse_workers or cpu_count()
+    queue_size = queue_size or parse_workers * 2
+    parse_queue = asyncio.Queue(maxsize=queue_size)
+    result_queue = asyncio.Queue(maxsize=queue_size)
+    stats = {'pages': 0, 'errors': 0, 'links': 0, 'bytes': 0}
+    url_iterator = iter(urls)
+    loop = asyncio.get_running_loop()
+
+    async def fetcher(session):
+        for url in url_iterator:
+            try:
+                async with session.get(url) as response:
+                    body = await response.read()
+                    status = response.status
+            except Exception as e:
+                print(f"Error while fetching {url}: {e}")
+                body, status = b'', None
+            stats['bytes'] += len(body)
+            await parse_queue.put((url, status, body))
+
+    async def parser(executor):
+        while True:
+            item = await parse_queue.get()
+            if item is _DONE:
+                return
+            url, status, body = item
+            links = []
+            if status is not None and status < 400 and body:
+                try:
+                    links = await loop.run_in_executor(executor, parse_links, url, body, selector)
+                except Exception as e:
+                    print(f"Error while parsing {url}: {e}")
+                    status = None
+            await result_queue.put({'url': url, 'status': status, 'links': links})
+
+    async def writer():
+        with open(output_path, 'w', encoding='utf-8') as output:
+            while True:
+                record = await result_queue.get()
+                if record is _DONE:
+                    return
+                stats['pages'] += 1
+                stats['links'] += len(record['links'])
+                if record['status'] is None or record['status'] >= 400:
+                    stats['errors'] += 1
+                output.write(json.dumps(record) + '\n')
+
+    start_time = time.time()
+    connector = aiohttp.TCPConnector(limit=fetch_concurrency)
+    with ProcessPoolExecutor(parse_workers) as executor:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            writer_task = asyncio.create_task(writer())
+            # Twice as many parse tasks as processes keeps every worker busy while results are handed on
+            parser_tasks = [asyncio.create_task(parser(executor)) for _ in range(parse_workers * 2)]
+            fetcher_tasks = [asyncio.create_task(fetcher(session)) for _ in range(fetch_concurrency)]
+
+            async def close_stages():
+                # Each stage is told to stop once the stage before it has finished
+                await asyncio.gather(*fetcher_tasks)
+                for _ in parser_tasks:
+                    await parse_queue.put(_DONE)
+                await asyncio.gather(*parser_tasks)
+                await result_queue.put(_DONE)
+
+            closer_task = asyncio.create_task(close_stages())
+            tasks = [writer_task, closer_task, *parser_tasks, *fetcher_tasks]
+            try:
+                # If the writer fails nothing drains the queues and every other stage would block
+                # on a full one, so the first failure stops the whole pipeline and is re-raised
+                done, _ = await asyncio.wait([writer_task, closer_task], return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    task.result()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    stats['duration'] = time.time() - start_time
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch pages concurrently and extract their links on all cores.")
+    parser.add_argument('--list-url', default=COUNTRIES_LIST, help="page whose country links are crawled")
+    parser.add_argument('--selector', default='a[href]', help="CSS selector for links extracted from each page")
+    parser.add_argument('--output', default='links.jsonl')
+    parser.add_argument('--fetch-concurrency', type=int, default=64)
+    parser.add_argument('--parse-workers', type=int, default=None)
+    parser.add_argument('--queue-size', type=int, default=None)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    links = get_links(args.list_url)
+    print(f'Total page: {len(links)}')
+    stats = asyncio.run(run_pipeline(links, args.output, args.selector, args.fetch_concurrency,
+                                     args.parse_workers, args.queue_size))
+    print(f"Processed {stats['pages']} pages ({stats['errors']} errors, {stats['links']} links, "
+          f"{stats['bytes']} bytes) in {stats['duration']} seconds")
@@ -0,0 +1,193 @@
+import re
+import math
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def chunk_text(text, chunk_size=1500, overlap=200):
+    # Overlapping character windows, cut back to the last whitespace so words stay whole
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_size)
+        if end < len(text):
+            space = text.rfind(' ', start + chunk_size // 2, end)
+            if space != -1:
+                end = space
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        total = len(chunks)
+        self.idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def scores(self, query):
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+            for term in terms:
+                frequency = counts.get(term)
+                if frequency:
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+
+# Local dense embedder: feature-hashed bag of words, L2-normalised. Any callable that
+# maps a list of strings to a 2-D array (for example an OpenAI embeddings client) can
+# be passed as the embedder instead.
+class HashingEmbedder:
+    def __init__(self, dimensions=1024):
+        self.dimensions = dimensions
+        # Identifies the vectors this embedder produces in the artifact cache
+        self.cache_key = f"hashing-{dimensions}"
+
+    def __call__(self, texts):
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term, count in Counter(tokenize(text)).items():
+                digest = hashlib.blake2b(term.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], 'little') % self.dimensions
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign * (1 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+
+class DenseIndex:
+    def __init__(self, chunks, embedder, vectors=None):
+        import numpy as np
+
+        self.embedder = embedder
+        if vectors is None:
+            vectors = embedder(chunks)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.vectors = vectors / norms
+
+    def scores(self, query):
+        import numpy as np
+
+        query_vector = np.asarray(self.embedder([query]), dtype=np.float32)[0]
+        query_vector /= (np.linalg.norm(query_vector) or 1)
+        return (self.vectors @ query_vector).tolist()
+
+
+def _ranks(scores):
+    order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    return {index: rank for rank, index in enumerate(order)}
+
+
+# Chunks of one document plus its BM25 index and, with an embedder, a dense index.
+# With both, results are merged by reciprocal rank fusion.
+class DocumentIndex:
+    def __init__(self, text, chunk_size=1500, overlap=200, embedder=None, chunks=None, vectors=None):
+        self.chunks = chunks if chunks is not None else chunk_text(text, chunk_size, overlap)
+        self.bm25 = BM25Index(self.chunks)
+        self.dense = DenseIndex(self.chunks, embedder, vectors) if embedder is not None and self.chunks else None
+
+    def top_k(self, query, k=5):
+        if len(self.chunks) <= k:
+            return list(range(len(self.chunks)))
+        rankings = [_ranks(self.bm25.scores(query))]
+        if self.dense is not None:
+            rankings.append(_ranks(self.dense.scores(query)))
+        fused = {index: sum(1 / (60 + ranking[index]) for ranking in rankings) for index in range(len(self.chunks))}
+        return sorted(fused, key=fused.get, reverse=True)[:k]
+
+    def context_for(self, queries, k=5):
+        # Union of the top chunks for every query, in document order
+        selected = sorted({index for query in queries for index in self.top_k(query, k)})
+        return "\n\n".join(self.chunks[index] for index in selected)
+
+
+def embedder_key(embedder):
+    return getattr(embedder, 'cache_key', type(embedder).__name__)
+
+
+# Per-document index cache so follow-up questions on the same text reuse the index.
+# With an artifact cache and a document key (the PDF's SHA-256), chunks and embeddings
+# also persist on disk and are reused across processes and restarts.
+class IndexCache:
+    def __init__(self, max_documents=32, artifact_cache=None, chunk_size=1500, overlap=200, embedder=None):
+        self.max_documents = max_documents
+        self.artifact_cache = artifact_cache
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.embedder = embedder
+        self.chunker_key = f"chars-{chunk_size}-{overlap}"
+        self.indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self._building = {}  # key -> [build lock, number of callers waiting on it]
+
+    def _build(self, text, document_key):
+        options = {'chunk_size': self.chunk_size, 'overlap': self.overlap, 'embedder': self.embedder}
+        if self.artifact_cache is None or document_key is None:
+            return DocumentIndex(text, **options)
+
+        chunks = self.artifact_cache.get_chunks(document_key, self.chunker_key)
+        if chunks is None:
+            chunks = chunk_text(text, self.chunk_size, self.overlap)
+            self.artifact_cache.put_chunks(document_key, self.chunker_key, chunks)
+        vectors = None
+        if self.embedder is not None and chunks:
+            vectors = self.artifact_cache.get_embeddings(document_key, self.chunker_key, embedder_key(self.embedder))
+            if vectors is None:
+                vectors = self.embedder(chunks)
+                self.artifact_cache.put_embeddings(document_key, self.chunker_key, embedder_key(self.embedder), vectors)
+        return DocumentIndex(text, chunks=chunks, vectors=vectors, **options)
+
+    def get(self, text, document_key=None):
+        key = document_key or hashlib.sha256(text.encode('utf-8', errors='replace')).hexdigest()
+        with self._lock:
+            index = self.indexes.get(key)
+            if index is not None:
+                self.indexes.move_to_end(key)
+                return index
+            building = self._building.setdefault(key, [threading.Lock(), 0])
+            building[1] += 1
+
+        # Built under a per-document lock: other documents are not held up, and concurrent
+        # questions on the same new document wait for one build instead of repeating it
+        try:
+            with building[0]:
+                with self._lock:
+                    index = self.indexes.get(key)
+                if index is None:
+                    index = self._build(text, document_key)
+                    with self._lock:
+                        self.indexes[key] = index
+                        if len(self.indexes) > self.max_documents:
+                            self.indexes.popitem(last=False)
+                return index
+        finally:
+            with self._lock:
+                building[1] -= 1
+                if not building[1]:
+                    del self._building[key]
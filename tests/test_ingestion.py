@@ -0,0 +1,126 @@
+import os
+
+import pytest
+
+from ingestion import IngestManifest, InMemoryVectorStore, ingest_directory
+
+
+# Embeds each text as a small bag-of-letters vector and counts every text it is asked to embed
+class CountingEmbeddings:
+    def __init__(self):
+        self.embedded = 0
+
+    def _vector(self, text):
+        return [text.lower().count(letter) for letter in 'aeiourst']
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def load_pages(file_path, sha256):
+    # The test files are plain text with a .pdf name; one page per blank-line block
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.read().split('\n\n')
+
+
+def write(path, text, mtime_ns=None):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    directory = tmp_path / 'pdfs'
+    directory.mkdir()
+    write(directory / 'a.pdf', 'Annual report\n\nEmissions fell this year')
+    write(directory / 'b.pdf', 'Sustainability report\n\nWater use and waste')
+    manifest = IngestManifest(str(tmp_path / 'manifest.sqlite'))
+    yield str(directory), manifest
+    manifest.close()
+
+
+def ingest(directory, store, embeddings, manifest):
+    return ingest_directory(directory, store, embeddings, manifest, load_pages, batch_size=2, concurrency=1)
+
+
+def test_unchanged_corpus_embeds_nothing(corpus):
+    directory, manifest = corpus
+    embeddings = CountingEmbeddings()
+    store = InMemoryVectorStore(embeddings)
+
+    _, first = ingest(directory, store, embeddings, manifest)
+    assert first['added'] == 2
+    embedded = embeddings.embedded
+    records = dict(store.records)
+
+    _, second = ingest(directory, store, embeddings, manifest)
+    assert second['unchanged'] == 2
+    assert second['chunks_embedded'] == 0
+    assert embeddings.embedded == embedded
+    assert store.records == records
+
+
+def test_changed_and_deleted_files_drop_stale_chunks(corpus):
+    directory, manifest = corpus
+    embeddings = CountingEmbeddings()
+    store = InMemoryVectorStore(embeddings)
+    ingest(directory, store, embeddings, manifest)
+    old_ids = set(manifest.get(os.path.join(directory, 'a.pdf'))['chunk_ids'])
+    b_ids = set(manifest.get(os.path.join(directory, 'b.pdf'))['chunk_ids'])
+
+    write(os.path.join(directory, 'a.pdf'), 'Annual report, restated\n\nEmissions rose', mtime_ns=1)
+    os.remove(os.path.join(directory, 'b.pdf'))
+    documents, stats = ingest(directory, store, embeddings, manifest)
+
+    assert list(documents) == [os.path.join(directory, 'a.pdf')]
+    assert stats['updated'] == 1 and stats['removed'] == 1
+    assert stats['chunks_deleted'] == len(old_ids) + len(b_ids)
+    assert not (old_ids | b_ids) & set(store.records)
+    new_ids = manifest.get(os.path.join(directory, 'a.pdf'))['chunk_ids']
+    assert set(store.records) == set(new_ids)
+    assert 'restated' in store.records[new_ids[0]][0]
+    assert manifest.get(os.path.join(directory, 'b.pdf')) is None
+
+
+def test_similarity_search_returns_documents(corpus):
+    pytest.importorskip('langchain')
+    directory, manifest = corpus
+    embeddings = CountingEmbeddings()
+    store = InMemoryVectorStore(embeddings)
+    ingest(directory, store, embeddings, manifest)
+
+    file_path = os.path.join(directory, 'b.pdf')
+    documents = store.similarity_search('water', k=5, filter={'file_path': file_path})
+    assert documents
+    assert all(document.metadata['file_path'] == file_path for document in documents)
+    assert all(isinstance(document.page_content, str) for document in documents)
+
+
+def test_same_pdf_at_a_new_path_reuses_cached_vectors(corpus, tmp_path):
+    pytest.importorskip('numpy')
+    from artifact_cache import ArtifactCache
+
+    directory, manifest = corpus
+    embeddings = CountingEmbeddings()
+    store = InMemoryVectorStore(embeddings)
+    artifact_cache = ArtifactCache(str(tmp_path / 'artifacts'))
+    ingest_directory(directory, store, embeddings, manifest, load_pages, batch_size=2, concurrency=1,
+                     artifact_cache=artifact_cache)
+    embedded = embeddings.embedded
+
+    os.rename(os.path.join(directory, 'a.pdf'), os.path.join(directory, 'renamed.pdf'))
+    _, stats = ingest_directory(directory, store, embeddings, manifest, load_pages, batch_size=2, concurrency=1,
+                                artifact_cache=artifact_cache)
+
+    assert stats['added'] == 1 and stats['removed'] == 1
+    assert stats['chunks_embedded'] == 0 and stats['chunks_reused'] > 0
+    assert embeddings.embedded == embedded
+    new_ids = manifest.get(os.path.join(directory, 'renamed.pdf'))['chunk_ids']
+    assert all(store.records[chunk_id][2]['file_path'].endswith('renamed.pdf') for chunk_id in new_ids)
+    assert all('page_start' in store.records[chunk_id][2] for chunk_id in new_ids)